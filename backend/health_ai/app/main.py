@@ -1,14 +1,30 @@
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+import shutil
+import asyncio
+import tempfile
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
 from typing import List, Optional
 import logging
 
 # Import our OCR and NER services
 from .services.ocr_service import OCRProcessor
 from .services.ner_processor import NERProcessor
-from .services.embedding_service import EmbeddingService
+from .services.embedding_service import EmbeddingService, LEGACY_EMBEDDING_VERSION
+from .services.metrics import (
+    REQUEST_LATENCY, INFLIGHT_REQUESTS, SHED_REQUESTS, ABORTED_REQUESTS, WASTED_COMPUTE_SECONDS,
+    render_metrics
+)
+from .services.deadline import Deadline, RequestAborted, WorkEstimator, DEADLINE_HEADER, shed_reason
+from .services.profiler import SamplingProfiler
+from .services.search_index import HybridSearchIndex
+from .services.entity_index import EntityIndex
+from .services.quantization import Int8Codec, create_codec
+from .services.reindexer import BackgroundReindexer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,10 +41,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Uploads are streamed to disk in chunks of this size instead of read into memory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# Directory shared with the Node backend; enables /api/ocr/process-local when set
+SHARED_UPLOAD_DIR = os.getenv("SHARED_UPLOAD_DIR")
+
+# Opt-in sampling profiler, exposed under /debug/profiler when enabled
+PROFILER_ENABLED = os.getenv("ENABLE_PROFILER", "false").lower() == "true"
+
 # Initialize services
 ocr_processor = OCRProcessor()
 ner_processor = NERProcessor()
 embedding_service = EmbeddingService()
+profiler = SamplingProfiler()
+# Vector storage of the search index: none (float32), int8 or pq (needs PQ_CODEBOOK_PATH)
+search_index = HybridSearchIndex(codec=create_codec(
+    os.getenv("EMBEDDING_COMPRESSION", "none"),
+    os.getenv("PQ_CODEBOOK_PATH")
+))
+search_index.set_dimensions(embedding_service.version, embedding_service.dimensions)
+entity_index = EntityIndex()
+# Seconds per page/chunk of recent requests, for shedding requests that cannot meet their deadline
+work_estimator = WorkEstimator()
+
+# Requests currently being served; the re-indexer only runs while this is zero
+active_requests = 0
+
+reindexer = BackgroundReindexer(
+    search_index,
+    embedding_service,
+    is_busy=lambda: active_requests > 0,
+    batch_size=int(os.getenv("REINDEX_BATCH_SIZE", "4")),
+    pause=float(os.getenv("REINDEX_PAUSE_SECONDS", "1.0")),
+    max_pending=int(os.getenv("REINDEX_MAX_PENDING", "100"))
+)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if os.getenv("REINDEX_ENABLED", "true").lower() == "true":
+        reindexer.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await reindexer.stop()
+    ocr_processor.close()
+
+def route_label(scope) -> str:
+    """Path template of the route a request goes to ("/api/index/reports/{user_id}"),
+    "other" for unknown paths, to keep metric cardinality bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Record per-endpoint latency and the number of requests in flight"""
+    endpoint = route_label(request.scope)
+    if endpoint == "/metrics":
+        return await call_next(request)
+    
+    global active_requests
+    start_time = time.perf_counter()
+    status = 500
+    active_requests += 1
+    INFLIGHT_REQUESTS.labels(endpoint=endpoint).inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        active_requests -= 1
+        INFLIGHT_REQUESTS.labels(endpoint=endpoint).dec()
+        REQUEST_LATENCY.labels(endpoint=endpoint, status=str(status)).observe(
+            time.perf_counter() - start_time
+        )
 
 # Response models
 class OCRResponse(BaseModel):
@@ -37,6 +126,7 @@ class OCRResponse(BaseModel):
     pages: Optional[int] = None
     char_count: Optional[int] = None
     processing_time: float
+    queue_time: Optional[float] = None
     error: Optional[str] = None
 
 class Entity(BaseModel):
@@ -54,18 +144,38 @@ class NERResponse(BaseModel):
     processing_time: float
     error: Optional[str] = None
 
+class LocalFileRequest(BaseModel):
+    path: str
+    filename: Optional[str] = None
+    mime_type: Optional[str] = None
+
 class TextRequest(BaseModel):
     text: str
+    # When both are set the extracted entities are added to the entity index
+    user_id: Optional[str] = None
+    report_id: Optional[str] = None
+    report_date: Optional[str] = None
 
 class EmbeddingRequest(BaseModel):
     text: str
     split_into_chunks: bool = True
+    # When both are set the chunks are added to the hybrid search index
+    user_id: Optional[str] = None
+    report_id: Optional[str] = None
+    # "int8" adds base64 int8 codes + scale per chunk for compact storage
+    compression: Optional[str] = None
+
+class CompressedEmbedding(BaseModel):
+    codes: str
+    scale: float
 
 class EmbeddingResponse(BaseModel):
     success: bool
     embeddings: Optional[List[List[float]]] = None
+    compressed_embeddings: Optional[List[CompressedEmbedding]] = None
     chunk_count: Optional[int] = None
     chunks: Optional[List[str]] = None
+    model_version: Optional[str] = None
     processing_time: float
     error: Optional[str] = None
 
@@ -85,6 +195,64 @@ class SearchResponse(BaseModel):
     processing_time: float
     error: Optional[str] = None
 
+class HybridSearchRequest(BaseModel):
+    user_id: str
+    query: str
+    top_k: int = 5
+    alpha: float = 0.5
+
+class HybridSearchResult(BaseModel):
+    report_id: str
+    chunk_index: int
+    text: str
+    score: float
+    similarity: float
+    lexical_score: float
+
+class HybridSearchResponse(BaseModel):
+    success: bool
+    results: Optional[List[HybridSearchResult]] = None
+    indexed_chunks: Optional[int] = None
+    vectors_scored: Optional[int] = None
+    lexical_candidates: Optional[int] = None
+    model_version: Optional[str] = None
+    # Versions searched; more than one while the user's reports are being re-indexed
+    model_versions: Optional[List[str]] = None
+    processing_time: float
+    error: Optional[str] = None
+
+class IndexedChunk(BaseModel):
+    text: str
+    chunk_index: int
+    # Either the float vector or its int8 compressed form
+    vector: Optional[List[float]] = None
+    codes: Optional[str] = None
+    scale: Optional[float] = None
+
+class UpgradedReport(BaseModel):
+    user_id: str
+    report_id: str
+    generation: int
+
+class AcknowledgeUpgradesRequest(BaseModel):
+    reports: List[UpgradedReport]
+
+class IndexEntitiesRequest(BaseModel):
+    user_id: str
+    report_id: str
+    entities: List[Entity]
+    report_date: Optional[str] = None
+    text: Optional[str] = None
+
+class IndexReportRequest(BaseModel):
+    user_id: str
+    report_id: str
+    chunks: List[IndexedChunk]
+    # Embedding version the vectors were produced with (untagged vectors are legacy)
+    version: str = LEGACY_EMBEDDING_VERSION
+    # Full report text, lets the re-indexer re-chunk the report after upgrades
+    text: Optional[str] = None
+
 @app.get("/health")
 def health_check():
     return {
@@ -94,23 +262,160 @@ def health_check():
         "capabilities": ["OCR", "Medical NER", "Document Processing"]
     }
 
+def _copy_upload(file: UploadFile) -> str:
+    spool = tempfile.NamedTemporaryFile(prefix="ocr-", dir=UPLOAD_SPOOL_DIR, delete=False)
+    try:
+        with spool:
+            shutil.copyfileobj(file.file, spool, UPLOAD_CHUNK_SIZE)
+    except Exception:
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+async def spool_upload(file: UploadFile) -> str:
+    """Copy an upload to a temp file chunk by chunk and return its path.
+
+    Starlette has already spooled the multipart body to its own temp file,
+    so this is a disk-to-disk copy and runs in the threadpool.
+    """
+    return await run_in_threadpool(_copy_upload, file)
+
+async def watch_disconnect(request: Request, deadline: Deadline):
+    """Cancel the deadline once the client has gone away.
+
+    The body has been read before the endpoint runs, so the next ASGI
+    message can only be the disconnect.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            deadline.cancel("disconnected")
+            return
+
+async def run_with_deadline(request: Request, operation: str, units: int, work,
+                            queued_units: float = 0.0):
+    """Run ``work(deadline)`` under the deadline from the request headers.
+
+    Requests whose estimated work (``units`` pages or chunks of ``operation``,
+    plus ``queued_units`` of earlier requests they wait for) does not fit in
+    the remaining time are rejected with 503 before starting (see
+    shed_reason). Work stops early, between pages or batches, when the
+    deadline passes (504) or the client disconnects (499). Time spent on
+    results nobody received is counted as wasted compute. A ``queue_time``
+    in the result is left out of the per-unit estimate.
+    """
+    endpoint = request.url.path
+    deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+    
+    reason = shed_reason(deadline, work_estimator, operation, units + queued_units)
+    if reason:
+        SHED_REQUESTS.labels(endpoint=endpoint).inc()
+        raise HTTPException(status_code=503, detail=reason)
+    
+    watcher = asyncio.create_task(watch_disconnect(request, deadline))
+    start_time = time.perf_counter()
+    try:
+        result = await work(deadline)
+    except RequestAborted as e:
+        elapsed = time.perf_counter() - start_time
+        ABORTED_REQUESTS.labels(endpoint=endpoint, reason=e.reason).inc()
+        WASTED_COMPUTE_SECONDS.labels(endpoint=endpoint, reason=e.reason).inc(elapsed)
+        logger.warning(f"{endpoint}: {e} after {elapsed:.2f}s")
+        raise HTTPException(status_code=504 if e.reason == "deadline" else 499, detail=str(e))
+    finally:
+        watcher.cancel()
+    
+    elapsed = time.perf_counter() - start_time
+    if result["success"]:
+        work_estimator.observe(operation, units, elapsed - result.get("queue_time", 0))
+    if deadline.expired:
+        # Finished, but after the caller stopped waiting
+        WASTED_COMPUTE_SECONDS.labels(endpoint=endpoint, reason="late").inc(elapsed)
+    return result
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/debug/profiler/start")
+def start_profiler(interval_ms: int = 10, include_idle: bool = False):
+    """Start the sampling profiler (requires ENABLE_PROFILER=true)"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is not enabled")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    
+    started = profiler.start(interval=interval_ms / 1000, include_idle=include_idle)
+    return {"success": True, "running": True, "already_running": not started}
+
+@app.post("/debug/profiler/stop")
+def stop_profiler():
+    """Stop the profiler and return folded stacks for flamegraph.pl / speedscope"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is not enabled")
+    
+    return Response(content=profiler.stop(), media_type="text/plain")
+
 @app.post("/api/ocr/process", response_model=OCRResponse)
-async def process_document(file: UploadFile = File(...)):
+async def process_document(http_request: Request, file: UploadFile = File(...)):
     """Extract text from PDF or image files using OCR"""
     
     if not file:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Read file content
-    content = await file.read()
-    if len(content) == 0:
+    # Spool to disk so the document is never held in memory as a whole
+    path = await spool_upload(file)
+    try:
+        if os.path.getsize(path) == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+        
+        # Process with OCR
+        filename = file.filename or "unknown"
+        mime_type = file.content_type or "application/octet-stream"
+        pages = await run_in_threadpool(ocr_processor.count_pages, path, filename, mime_type)
+        result = await run_with_deadline(
+            http_request,
+            "ocr_page",
+            pages,
+            lambda deadline: ocr_processor.process_path(path, filename, mime_type, deadline=deadline, pages=pages),
+            queued_units=ocr_processor.queued_pages()
+        )
+    finally:
+        os.unlink(path)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=422, detail=result.get("error", "Processing failed"))
+    
+    return OCRResponse(**result)
+
+@app.post("/api/ocr/process-local", response_model=OCRResponse)
+async def process_local_document(request: LocalFileRequest, http_request: Request):
+    """Extract text from a file the caller already wrote to the shared upload directory"""
+    if not SHARED_UPLOAD_DIR:
+        raise HTTPException(status_code=404, detail="Local file processing is not enabled")
+    
+    # Only allow files inside the shared directory
+    shared_dir = os.path.realpath(SHARED_UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(shared_dir, request.path))
+    if os.path.commonpath([shared_dir, path]) != shared_dir:
+        raise HTTPException(status_code=400, detail="Path is outside the shared upload directory")
+    
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if os.path.getsize(path) == 0:
         raise HTTPException(status_code=400, detail="Empty file")
     
-    # Process with OCR
-    result = await ocr_processor.process_file(
-        file_content=content,
-        filename=file.filename or "unknown",
-        mime_type=file.content_type or "application/octet-stream"
+    filename = request.filename or os.path.basename(path)
+    mime_type = request.mime_type or "application/octet-stream"
+    pages = await run_in_threadpool(ocr_processor.count_pages, path, filename, mime_type)
+    result = await run_with_deadline(
+        http_request,
+        "ocr_page",
+        pages,
+        lambda deadline: ocr_processor.process_path(path, filename, mime_type, deadline=deadline, pages=pages),
+        queued_units=ocr_processor.queued_pages()
     )
     
     if not result["success"]:
@@ -119,12 +424,17 @@ async def process_document(file: UploadFile = File(...)):
     return OCRResponse(**result)
 
 @app.post("/api/ner/extract", response_model=NERResponse)
-async def extract_entities(request: TextRequest):
+async def extract_entities(request: TextRequest, http_request: Request):
     """Extract medical entities from text"""
     if not request.text or len(request.text.strip()) < 10:
         raise HTTPException(status_code=400, detail="Text too short or empty")
     
-    result = await ner_processor.extract_entities(request.text)
+    result = await run_with_deadline(
+        http_request,
+        "ner_chunk",
+        ner_processor.count_chunks(request.text),
+        lambda deadline: ner_processor.extract_entities(request.text, deadline=deadline)
+    )
     
     if not result["success"]:
         raise HTTPException(
@@ -132,17 +442,36 @@ async def extract_entities(request: TextRequest):
             detail=result.get("error", "Entity extraction failed")
         )
     
+    if request.user_id and request.report_id:
+        entity_index.add_report(
+            request.user_id,
+            request.report_id,
+            result["entities"],
+            report_date=request.report_date,
+            text=request.text
+        )
+    
     return result
 
 @app.post("/api/embeddings/generate", response_model=EmbeddingResponse)
-async def generate_embeddings(request: EmbeddingRequest):
+async def generate_embeddings(request: EmbeddingRequest, http_request: Request):
     """Generate vector embeddings for text"""
     if not request.text or len(request.text.strip()) < 10:
         raise HTTPException(status_code=400, detail="Text too short or empty")
     
-    result = await embedding_service.get_embeddings(
-        request.text, 
-        split_into_chunks=request.split_into_chunks
+    if request.compression not in (None, "int8"):
+        raise HTTPException(status_code=400, detail="compression must be 'int8'")
+    
+    result = await run_with_deadline(
+        http_request,
+        "embedding_chunk",
+        embedding_service.count_chunks(request.text, request.split_into_chunks),
+        lambda deadline: embedding_service.get_embeddings(
+            request.text, 
+            split_into_chunks=request.split_into_chunks,
+            compression=request.compression,
+            deadline=deadline
+        )
     )
     
     if not result["success"]:
@@ -151,6 +480,20 @@ async def generate_embeddings(request: EmbeddingRequest):
             detail=result.get("error", "Embedding generation failed")
         )
     
+    if request.user_id and request.report_id:
+        try:
+            search_index.add_report(
+                request.user_id,
+                request.report_id,
+                result["chunks"] or [request.text],
+                result["embeddings"],
+                result["model_version"],
+                text=request.text
+            )
+        except ValueError as e:
+            logger.error(f"Could not index embeddings of report {request.report_id}: {e}")
+            raise HTTPException(status_code=422, detail=f"Could not index embeddings: {e}")
+    
     return result
 
 @app.post("/api/embeddings/search", response_model=SearchResponse)
@@ -174,4 +517,167 @@ async def search_documents(request: SearchRequest):
             detail=result.get("error", "Semantic search failed")
         )
     
-    return result
\ No newline at end of file
+    return result
+
+@app.post("/api/search/hybrid", response_model=HybridSearchResponse)
+async def hybrid_search(request: HybridSearchRequest):
+    """Search a user's indexed reports with BM25 + semantic scoring"""
+    if not request.query or len(request.query.strip()) < 3:
+        raise HTTPException(status_code=400, detail="Query too short or empty")
+    if not 0.0 <= request.alpha <= 1.0:
+        raise HTTPException(status_code=400, detail="alpha must be between 0 and 1")
+    
+    result = await embedding_service.hybrid_search(
+        search_index,
+        request.user_id,
+        request.query,
+        top_k=max(1, request.top_k),
+        alpha=request.alpha
+    )
+    
+    if not result["success"]:
+        raise HTTPException(
+            status_code=422, 
+            detail=result.get("error", "Hybrid search failed")
+        )
+    
+    return result
+
+@app.post("/api/index/reports")
+async def index_report(request: IndexReportRequest):
+    """Add previously embedded report chunks to the search index (e.g. after a restart)"""
+    if not request.chunks:
+        raise HTTPException(status_code=400, detail="No chunks provided")
+    
+    codec = Int8Codec()
+    vectors = []
+    for chunk in request.chunks:
+        if chunk.vector is not None:
+            vectors.append(chunk.vector)
+        elif chunk.codes is not None and chunk.scale is not None:
+            vectors.append(codec.decode(codec.from_base64(chunk.codes, chunk.scale)))
+        else:
+            raise HTTPException(status_code=400, detail="Each chunk needs a vector or codes and scale")
+    
+    try:
+        indexed = search_index.add_report(
+            request.user_id,
+            request.report_id,
+            [chunk.text for chunk in request.chunks],
+            vectors,
+            request.version,
+            chunk_indices=[chunk.chunk_index for chunk in request.chunks],
+            text=request.text
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "indexed_chunks": indexed, "version": request.version}
+
+@app.get("/api/index/reports/{user_id}")
+async def indexed_reports(user_id: str):
+    """Ids of a user's reports held by the search index, to find reports missing after a restart"""
+    return {"success": True, "report_ids": search_index.report_ids(user_id)}
+
+@app.get("/api/index/upgraded")
+async def upgraded_reports(limit: int = 20, compression: Optional[str] = None):
+    """Reports re-embedded by the re-indexer that the backend has not stored yet,
+    in the shape of /api/embeddings/generate; acknowledge them once stored"""
+    if compression not in (None, "int8"):
+        raise HTTPException(status_code=400, detail=f"Unsupported compression: {compression}")
+    
+    codec = Int8Codec()
+    reports = []
+    for upgrade in reindexer.pending_upgrades(max(1, limit)):
+        reports.append({
+            "user_id": upgrade["user_id"],
+            "report_id": upgrade["report_id"],
+            "generation": upgrade["generation"],
+            "model_version": upgrade["version"],
+            "chunks": upgrade["chunks"],
+            "embeddings": upgrade["vectors"],
+            "compressed_embeddings": (
+                [codec.to_base64(vector) for vector in upgrade["vectors"]] if compression else None
+            )
+        })
+    return {"success": True, "reports": reports}
+
+@app.post("/api/index/upgraded/ack")
+async def acknowledge_upgraded_reports(request: AcknowledgeUpgradesRequest):
+    """Mark re-embedded reports as stored by the backend"""
+    acknowledged = sum(
+        reindexer.acknowledge(report.user_id, report.report_id, report.generation)
+        for report in request.reports
+    )
+    return {"success": True, "acknowledged": acknowledged}
+
+@app.get("/api/index/reindex/status")
+async def reindex_status():
+    """Progress of the background re-indexer towards the current embedding version"""
+    return {"success": True, **reindexer.status()}
+
+@app.get("/api/index/stats")
+async def index_stats():
+    """Chunk count and vector memory of the search index"""
+    return {"success": True, **search_index.stats()}
+
+@app.delete("/api/index/reports/{user_id}/{report_id}")
+async def remove_indexed_report(user_id: str, report_id: str):
+    """Remove a report from the search index"""
+    removed = search_index.remove_report(user_id, report_id)
+    return {"success": True, "removed_chunks": removed}
+
+@app.get("/api/entities/search")
+async def search_entities(user_id: str, text: str, label: Optional[str] = None):
+    """Reports of a user that mention an entity, e.g. text=metformin"""
+    start_time = time.time()
+    results = entity_index.find_reports(user_id, text, label=label)
+    return {
+        "success": True,
+        "results": results,
+        "report_count": len(results),
+        "indexed_reports": entity_index.report_count(user_id),
+        "processing_time": round(time.time() - start_time, 4)
+    }
+
+@app.get("/api/entities/measurements")
+async def entity_measurements(user_id: str, analyte: str):
+    """Every recorded value of a lab/analyte over time, e.g. analyte=HbA1c"""
+    start_time = time.time()
+    results = entity_index.measurements(user_id, analyte)
+    return {
+        "success": True,
+        "results": results,
+        "indexed_reports": entity_index.report_count(user_id),
+        "processing_time": round(time.time() - start_time, 4)
+    }
+
+@app.get("/api/entities/summary")
+async def entity_summary(user_id: str):
+    """Number of reports per label and entity"""
+    return {
+        "success": True,
+        "labels": entity_index.summary(user_id),
+        "indexed_reports": entity_index.report_count(user_id)
+    }
+
+@app.post("/api/entities/reports")
+async def index_report_entities(request: IndexEntitiesRequest):
+    """Add previously extracted entities to the entity index (e.g. after a restart)"""
+    indexed = entity_index.add_report(
+        request.user_id,
+        request.report_id,
+        [entity.dict() for entity in request.entities],
+        report_date=request.report_date,
+        text=request.text
+    )
+    return {"success": True, "indexed_entities": indexed}
+
+@app.get("/api/entities/reports/{user_id}")
+async def entity_indexed_reports(user_id: str):
+    """Ids of a user's reports held by the entity index, to find reports missing after a restart"""
+    return {"success": True, "report_ids": entity_index.report_ids(user_id)}
+
+@app.delete("/api/entities/reports/{user_id}/{report_id}")
+async def remove_report_entities(user_id: str, report_id: str):
+    """Remove a report from the entity index"""
+    return {"success": True, "removed": entity_index.remove_report(user_id, report_id)}
@@ -0,0 +1,143 @@
+# health_ai/app/services/deadline.py
+import time
+import threading
+from typing import Optional, Dict
+import logging
+from .metrics import WORK_SECONDS_PER_UNIT
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline of a request as Unix epoch milliseconds, set by the caller
+# (the Node backend derives it from its axios timeout). Both services are
+# expected to share a clock, i.e. run on the same host or use NTP.
+DEADLINE_HEADER = "X-Request-Deadline"
+
+
+class RequestAborted(Exception):
+    """Raised from inside processing once its result can no longer be delivered"""
+
+    def __init__(self, reason: str, where: str):
+        self.reason = reason  # "deadline" or "disconnected"
+        self.where = where
+        super().__init__(f"Request aborted ({reason}) {where}")
+
+
+class Deadline:
+    """Time budget and cancellation flag of one request.
+
+    Shared between the event loop, which cancels it when the client goes
+    away, and the worker thread doing the work, which calls ``check``
+    between pages or batches. A deadline without ``expires_at`` never
+    expires but can still be cancelled.
+    """
+
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at  # time.time() based
+        self.reason = None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Deadline":
+        if not value:
+            return cls()
+        try:
+            return cls(float(value) / 1000)
+        except ValueError:
+            logger.warning(f"Ignoring malformed {DEADLINE_HEADER} header: {value!r}")
+            return cls()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "disconnected"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self, where: str):
+        """Raise RequestAborted if the request was cancelled or ran out of time"""
+        if self._cancelled.is_set():
+            raise RequestAborted(self.reason, where)
+        if self.expired:
+            raise RequestAborted("deadline", where)
+
+
+class WorkEstimator:
+    """Exponentially weighted average of seconds per unit of work (page, chunk).
+
+    Fed with the duration of completed requests and used to reject requests
+    up front whose estimated work does not fit in their remaining deadline.
+    Shed requests never run, so they cannot correct an estimate that is too
+    high (e.g. after one slow cold start). Estimates are therefore only given
+    after ``min_samples`` observations, and while requests are being shed one
+    is let through every ``probe_interval`` seconds to measure again.
+    """
+
+    def __init__(self, alpha: float = 0.2, min_samples: int = 3, probe_interval: float = 10.0,
+                 clock=time.monotonic):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.clock = clock
+        self._per_unit: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._last_probe: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation: str, units: int, seconds: float):
+        if units <= 0:
+            return
+        sample = seconds / units
+        with self._lock:
+            previous = self._per_unit.get(operation)
+            per_unit = sample if previous is None else previous + self.alpha * (sample - previous)
+            self._per_unit[operation] = per_unit
+            self._samples[operation] = self._samples.get(operation, 0) + 1
+        WORK_SECONDS_PER_UNIT.labels(operation=operation).set(per_unit)
+
+    def estimate(self, operation: str, units: float) -> Optional[float]:
+        """Estimated seconds for ``units`` of work, None until ``min_samples`` were observed"""
+        with self._lock:
+            if self._samples.get(operation, 0) < self.min_samples:
+                return None
+            return self._per_unit[operation] * units
+
+    def admit_probe(self, operation: str) -> bool:
+        """Whether a request that would be shed should run anyway to re-measure"""
+        now = self.clock()
+        with self._lock:
+            last = self._last_probe.get(operation)
+            if last is not None and now - last < self.probe_interval:
+                return False
+            self._last_probe[operation] = now
+            return True
+
+
+def shed_reason(deadline: Deadline, estimator: WorkEstimator, operation: str,
+                units: float) -> Optional[str]:
+    """Why a request should be rejected before it starts, or None to run it"""
+    remaining = deadline.remaining()
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        return "Request deadline already passed"
+    estimate = estimator.estimate(operation, units)
+    if estimate is None or estimate <= remaining:
+        return None
+    if estimator.admit_probe(operation):
+        logger.info(f"Running {operation} request as a probe despite an estimate of "
+                    f"{estimate:.2f}s for {remaining:.2f}s left")
+        return None
+    return f"Estimated {estimate:.2f}s of work exceeds the remaining {remaining:.2f}s"
@@ -2,24 +2,72 @@
 
 import time
 import os
+import threading
 from typing import List, Dict, Any
 import numpy as np
 import logging
 from sentence_transformers import SentenceTransformer
+from starlette.concurrency import run_in_threadpool
+from .metrics import observe_stage, observe_model_load, record_cache, STAGE_EMBEDDING_ENCODE, STAGE_SIMILARITY
+from .search_index import HybridSearchIndex
+from .quantization import Int8Codec
+from .deadline import Deadline, RequestAborted
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"  # Lightweight, efficient model
+
+# Bump whenever _split_text changes how text is chunked
+CHUNKER_VERSION = "v1"
+
+# Version of vectors stored before they were tagged
+LEGACY_EMBEDDING_VERSION = f"{DEFAULT_MODEL_NAME}@chunker-v1"
+
+
+def make_version(model_name: str, chunker_version: str = CHUNKER_VERSION) -> str:
+    return f"{model_name}@chunker-{chunker_version}"
+
+
+def model_from_version(version: str) -> str:
+    return version.split("@", 1)[0]
+
+
 class EmbeddingService:
+    request_batch_size = 16  # Chunks encoded per model call; deadlines are checked in between
+    
     def __init__(self):
         try:
             logger.info("Loading embedding model...")
-            self.model_name = "all-MiniLM-L6-v2"  # Lightweight, efficient model
-            self.model = SentenceTransformer(self.model_name)
-            logger.info(f"Embedding model {self.model_name} loaded successfully")
+            self.model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL_NAME)
+            # Tag stored with every vector; vectors of different versions are never compared
+            self.version = make_version(self.model_name)
+            with observe_model_load("embedding"):
+                self.model = SentenceTransformer(self.model_name)
+            self.dimensions = self.model.get_sentence_embedding_dimension()
+            # Older models are loaded on demand to answer queries while re-indexing
+            self._models = {self.model_name: self.model}
+            self._models_lock = threading.Lock()
+            logger.info(f"Embedding model {self.model_name} loaded successfully ({self.version})")
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
             raise
     
+    def _model_for(self, version: str) -> SentenceTransformer:
+        """Model that produced vectors of the given version"""
+        model_name = model_from_version(version)
+        with self._models_lock:
+            record_cache("embedding_model", hit=model_name in self._models)
+            if model_name not in self._models:
+                logger.info(f"Loading embedding model {model_name} to serve {version} vectors")
+                with observe_model_load(f"embedding:{model_name}"):
+                    self._models[model_name] = SentenceTransformer(model_name)
+            return self._models[model_name]
+    
+    def encode_batch(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        """Embed several texts with the current model in one call"""
+        with observe_stage(STAGE_EMBEDDING_ENCODE):
+            return self.model.encode(texts, batch_size=batch_size).tolist()
+    
     def _split_text(self, text: str, chunk_size: int = 200, overlap: int = 50) -> List[str]:
         """Split text into overlapping chunks"""
         if len(text) <= chunk_size:
@@ -33,8 +81,27 @@ class EmbeddingService:
             chunks.append(chunk)
         return chunks
     
-    async def get_embeddings(self, text: str, split_into_chunks: bool = True) -> Dict[str, Any]:
-        """Generate embeddings for text"""
+    def count_chunks(self, text: str, split_into_chunks: bool = True) -> int:
+        """Number of chunks the text will be embedded as, used to estimate the work of a request"""
+        return len(self._split_text(text)) if split_into_chunks else 1
+    
+    def _encode_chunks(self, chunks: List[str], deadline: Deadline) -> List[List[float]]:
+        """Encode chunks batch by batch, stopping between batches on deadline"""
+        embeddings = []
+        for i in range(0, len(chunks), self.request_batch_size):
+            deadline.check(f"before embedding chunk {i + 1} of {len(chunks)}")
+            batch = chunks[i:i + self.request_batch_size]
+            with observe_stage(STAGE_EMBEDDING_ENCODE):
+                # Convert to list to make serializable
+                embeddings.extend(self.model.encode(batch, batch_size=len(batch)).tolist())
+        return embeddings
+    
+    async def get_embeddings(self, text: str, split_into_chunks: bool = True,
+                             compression: str = None, deadline: Deadline = None) -> Dict[str, Any]:
+        """Generate embeddings for text, optionally with an int8 compressed copy for storage.
+
+        Raises RequestAborted when ``deadline`` expires or is cancelled.
+        """
         start_time = time.time()
         
         try:
@@ -45,23 +112,30 @@ class EmbeddingService:
             else:
                 chunks = [text]
             
-            # Generate embeddings
-            embeddings = []
-            for chunk in chunks:
-                # Convert to list to make serializable
-                embedding = self.model.encode(chunk).tolist()
-                embeddings.append(embedding)
+            # Generate embeddings off the event loop
+            embeddings = await run_in_threadpool(self._encode_chunks, chunks, deadline or Deadline())
+            
+            compressed = None
+            if compression == "int8":
+                codec = Int8Codec()
+                compressed = [codec.to_base64(embedding) for embedding in embeddings]
+            elif compression:
+                raise ValueError(f"Unsupported compression: {compression}")
             
             processing_time = time.time() - start_time
             
             return {
                 "success": True,
                 "embeddings": embeddings,
+                "compressed_embeddings": compressed,
                 "chunk_count": len(chunks),
                 "chunks": chunks if split_into_chunks else None,
+                "model_version": self.version,
                 "processing_time": round(processing_time, 2)
             }
             
+        except RequestAborted:
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             logger.error(f"Embedding generation failed: {e}")
@@ -76,27 +150,29 @@ class EmbeddingService:
         start_time = time.time()
         
         try:
-            # Generate query embedding
-            query_embedding = self.model.encode(query)
+            with observe_stage(STAGE_EMBEDDING_ENCODE):
+                # Generate query embedding
+                query_embedding = self.model.encode(query)
+                
+                # Generate document embeddings
+                doc_embeddings = self.model.encode(documents)
             
-            # Generate document embeddings
-            doc_embeddings = self.model.encode(documents)
-            
-            # Calculate similarities using cosine similarity
-            similarities = []
-            for i, doc_embedding in enumerate(doc_embeddings):
-                # Cosine similarity
-                similarity = np.dot(query_embedding, doc_embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding)
-                )
-                similarities.append({
-                    "index": i,
-                    "document": documents[i],
-                    "similarity": float(similarity)  # Convert to native Python float
-                })
-            
-            # Sort by similarity (descending)
-            similarities.sort(key=lambda x: x["similarity"], reverse=True)
+            with observe_stage(STAGE_SIMILARITY):
+                # Calculate similarities using cosine similarity
+                similarities = []
+                for i, doc_embedding in enumerate(doc_embeddings):
+                    # Cosine similarity
+                    similarity = np.dot(query_embedding, doc_embedding) / (
+                        np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding)
+                    )
+                    similarities.append({
+                        "index": i,
+                        "document": documents[i],
+                        "similarity": float(similarity)  # Convert to native Python float
+                    })
+                
+                # Sort by similarity (descending)
+                similarities.sort(key=lambda x: x["similarity"], reverse=True)
             
             # Return top-k results
             top_results = similarities[:top_k]
@@ -116,4 +192,64 @@ class EmbeddingService:
                 "success": False,
                 "error": str(e),
                 "processing_time": round(processing_time, 2)
-            }
\ No newline at end of file
+            }
+    
+    def _encode_queries(self, versions: List[str], query: str) -> Dict[str, Any]:
+        """Query embedding per version, from the model that produced that version's vectors.
+
+        Versions whose model cannot be loaded are left out.
+        """
+        embeddings = {}
+        for version in versions:
+            try:
+                model = self.model if version == self.version else self._model_for(version)
+            except Exception as e:
+                logger.warning(f"Cannot load model for {version} ({e}), its reports are not searched")
+                continue
+            with observe_stage(STAGE_EMBEDDING_ENCODE):
+                embeddings[version] = model.encode(query)
+        return embeddings
+    
+    async def hybrid_search(self, index: HybridSearchIndex, user_id: str, query: str,
+                            top_k: int = 5, alpha: float = 0.5) -> Dict[str, Any]:
+        """Search a user's indexed report chunks with BM25 + embeddings.
+
+        During a migration each report is searched with one version (see
+        HybridSearchIndex.search_plan) and the hits are merged by score, so
+        reports already on the current version stay searchable. Scores of
+        different models are not calibrated against each other.
+        """
+        start_time = time.time()
+        
+        try:
+            plan = index.search_plan(user_id, self.version) or {self.version: None}
+            # Loading an older model and encoding both block, keep them off the event loop
+            embeddings = await run_in_threadpool(self._encode_queries, list(plan), query)
+            
+            result = {"results": [], "indexed_chunks": 0, "vectors_scored": 0, "lexical_candidates": 0,
+                      "model_version": index.serving_version(user_id, self.version) or self.version,
+                      "model_versions": list(embeddings)}
+            for version, query_embedding in embeddings.items():
+                partial = index.search(user_id, query, query_embedding, version,
+                                       top_k=top_k, alpha=alpha, report_ids=plan[version])
+                result["results"].extend(partial["results"])
+                for counter in ("indexed_chunks", "vectors_scored", "lexical_candidates"):
+                    result[counter] += partial[counter]
+            result["results"] = sorted(result["results"], key=lambda hit: hit["score"], reverse=True)[:top_k]
+            
+            processing_time = time.time() - start_time
+            
+            return {
+                "success": True,
+                **result,
+                "processing_time": round(processing_time, 2)
+            }
+            
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(f"Hybrid search failed: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "processing_time": round(processing_time, 2)
+            }
@@ -0,0 +1,201 @@
+# health_ai/app/services/entity_index.py
+import re
+import threading
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Labels whose entities carry a numeric result (model and rule-based NER)
+VALUE_LABELS = {"Lab_value", "MEASUREMENT"}
+
+# How far before a value we look for the thing that was measured
+ANALYTE_WINDOW = 40
+
+VALUE_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)\s*(%|[a-zA-Zμ/]+(?:/[a-zA-Z0-9]+)?)?")
+ADJACENT_GAP_PATTERN = re.compile(r"[\s:=\-]*")
+TRAILING_TERM_PATTERN = re.compile(r"([A-Za-z][A-Za-z0-9\-]*(?: [A-Za-z][A-Za-z0-9\-]*)?)\W*$")
+
+
+def normalize_entity_text(text: str) -> str:
+    """Normalize entity text for index keys ("  Metformin," -> "metformin")"""
+    text = re.sub(r"\s+", " ", text.lower())
+    return text.strip(" .,;:()[]\"'")
+
+
+def parse_value(text: str) -> Optional[Dict[str, Any]]:
+    """Parse "8.4 %" or "120 mg/dl" into a number and unit"""
+    match = VALUE_PATTERN.search(text)
+    if not match:
+        return None
+    return {"value": float(match.group(1)), "unit": match.group(2) or ""}
+
+
+class EntityIndex:
+    """Inverted index of NER entities keyed by user, label and normalized text.
+
+    Only the entities themselves are stored, so structured questions such as
+    "which reports mention metformin" or "every HbA1c result over time" are
+    answered without loading any report.
+    """
+
+    def __init__(self):
+        # user_id -> normalized text -> label -> report_id -> [mention]
+        self._entities = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        # user_id -> normalized analyte -> report_id -> [measurement]
+        self._measurements = defaultdict(lambda: defaultdict(dict))
+        # user_id -> report_id -> report metadata and the keys it contributed
+        self._reports = defaultdict(dict)
+        self._lock = threading.RLock()
+
+    def _find_analyte(self, entities: List[Dict[str, Any]], position: int,
+                      text: Optional[str]) -> Optional[str]:
+        """Name of the test a value belongs to.
+
+        An entity directly in front of the value ("HbA1c: 8.4 %") wins, then the
+        words directly in front of it, then the closest entity on the same line.
+        """
+        value = entities[position]
+        nearest = None
+        for previous in reversed(entities[:position]):
+            if value["start"] - previous["end"] > ANALYTE_WINDOW:
+                break
+            # Values never belong to a term on an earlier line
+            if text and "\n" in text[previous["end"]:value["start"]]:
+                break
+            if previous["label"] not in VALUE_LABELS:
+                nearest = previous
+                break
+
+        if nearest and (not text or ADJACENT_GAP_PATTERN.fullmatch(text[nearest["end"]:value["start"]])):
+            return normalize_entity_text(nearest["text"])
+
+        if text:
+            window = text[max(0, value["start"] - ANALYTE_WINDOW):value["start"]]
+            match = TRAILING_TERM_PATTERN.search(window.split("\n")[-1])
+            if match:
+                return normalize_entity_text(match.group(1))
+
+        return normalize_entity_text(nearest["text"]) if nearest else None
+
+    def add_report(self, user_id: str, report_id: str, entities: List[Dict[str, Any]],
+                   report_date: Optional[str] = None, text: Optional[str] = None) -> int:
+        """Index (or re-index) one report's entities; returns the number indexed"""
+        entities = sorted(entities, key=lambda e: e["start"])
+
+        with self._lock:
+            self.remove_report(user_id, report_id)
+
+            entity_keys = set()
+            measurement_keys = set()
+            for position, entity in enumerate(entities):
+                key = normalize_entity_text(entity["text"])
+                if not key:
+                    continue
+                mention = {
+                    "text": entity["text"],
+                    "confidence": entity.get("confidence"),
+                    "start": entity["start"],
+                    "end": entity["end"]
+                }
+                by_report = self._entities[user_id][key][entity["label"]]
+                by_report.setdefault(report_id, []).append(mention)
+                entity_keys.add((key, entity["label"]))
+
+                if entity["label"] in VALUE_LABELS:
+                    parsed = parse_value(entity["text"])
+                    analyte = self._find_analyte(entities, position, text)
+                    if parsed and analyte:
+                        series = self._measurements[user_id][analyte]
+                        series.setdefault(report_id, []).append({**parsed, "text": entity["text"]})
+                        measurement_keys.add(analyte)
+
+            self._reports[user_id][report_id] = {
+                "report_date": report_date,
+                "entity_keys": entity_keys,
+                "measurement_keys": measurement_keys
+            }
+
+        logger.info(f"Indexed {len(entities)} entities for report {report_id}")
+        return len(entities)
+
+    def remove_report(self, user_id: str, report_id: str) -> bool:
+        with self._lock:
+            report = self._reports.get(user_id, {}).pop(report_id, None)
+            if report is None:
+                return False
+
+            for key, label in report["entity_keys"]:
+                labels = self._entities[user_id][key]
+                labels[label].pop(report_id, None)
+                if not labels[label]:
+                    del labels[label]
+                if not labels:
+                    del self._entities[user_id][key]
+
+            for analyte in report["measurement_keys"]:
+                series = self._measurements[user_id][analyte]
+                series.pop(report_id, None)
+                if not series:
+                    del self._measurements[user_id][analyte]
+            return True
+
+    def report_count(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._reports.get(user_id, {}))
+
+    def report_ids(self, user_id: str) -> List[str]:
+        """Reports of a user held by the index"""
+        with self._lock:
+            return sorted(self._reports.get(user_id, {}))
+
+    def _report_date(self, user_id: str, report_id: str) -> Optional[str]:
+        return self._reports[user_id][report_id]["report_date"]
+
+    def find_reports(self, user_id: str, text: str, label: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Reports mentioning an entity, newest first"""
+        key = normalize_entity_text(text)
+        with self._lock:
+            labels = self._entities.get(user_id, {}).get(key, {})
+            matches = defaultdict(lambda: {"labels": set(), "mentions": []})
+            for entity_label, by_report in labels.items():
+                if label and entity_label != label:
+                    continue
+                for report_id, mentions in by_report.items():
+                    matches[report_id]["labels"].add(entity_label)
+                    matches[report_id]["mentions"].extend(mentions)
+
+            results = [{
+                "report_id": report_id,
+                "report_date": self._report_date(user_id, report_id),
+                "labels": sorted(match["labels"]),
+                "mention_count": len(match["mentions"]),
+                "mentions": match["mentions"]
+            } for report_id, match in matches.items()]
+
+        results.sort(key=lambda r: r["report_date"] or "", reverse=True)
+        return results
+
+    def measurements(self, user_id: str, analyte: str) -> List[Dict[str, Any]]:
+        """Every recorded value for an analyte, oldest first"""
+        key = normalize_entity_text(analyte)
+        with self._lock:
+            series = self._measurements.get(user_id, {}).get(key, {})
+            results = [{
+                "report_id": report_id,
+                "report_date": self._report_date(user_id, report_id),
+                **measurement
+            } for report_id, values in series.items() for measurement in values]
+
+        results.sort(key=lambda r: r["report_date"] or "")
+        return results
+
+    def summary(self, user_id: str) -> Dict[str, Dict[str, int]]:
+        """Number of reports per label and entity, for browsing"""
+        with self._lock:
+            summary = defaultdict(dict)
+            for key, labels in self._entities.get(user_id, {}).items():
+                for label, by_report in labels.items():
+                    summary[label][key] = len(by_report)
+        return dict(summary)
@@ -0,0 +1,130 @@
+# health_ai/app/services/metrics.py
+import time
+from contextlib import contextmanager
+import logging
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Buckets from 5ms up to 2 minutes (whole multi-page OCR requests)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "health_ai_request_duration_seconds",
+    "End-to-end request latency per endpoint",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+STAGE_LATENCY = Histogram(
+    "health_ai_stage_duration_seconds",
+    "Latency of individual processing stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+INFLIGHT_REQUESTS = Gauge(
+    "health_ai_inflight_requests",
+    "Requests queued or being processed per endpoint",
+    ["endpoint"]
+)
+
+CACHE_REQUESTS = Counter(
+    "health_ai_cache_requests_total",
+    "Cache lookups by cache (embedding_model) and result (hit/miss)",
+    ["cache", "result"]
+)
+
+OCR_BACKLOG = Gauge(
+    "health_ai_ocr_backlog",
+    "OCR jobs queued for or running on the OCR worker pool"
+)
+
+MODEL_LOAD_SECONDS = Gauge(
+    "health_ai_model_load_seconds",
+    "Time taken to load each model at startup",
+    ["model"]
+)
+
+SEARCH_VECTOR_FRACTION = Histogram(
+    "health_ai_search_vector_fraction",
+    "Fraction of a user's indexed vectors scored per hybrid search",
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+)
+
+REINDEX_STALE_REPORTS = Gauge(
+    "health_ai_reindex_stale_reports",
+    "Indexed reports whose vectors are not on the current embedding version"
+)
+
+REINDEXED_REPORTS = Counter(
+    "health_ai_reindexed_reports_total",
+    "Reports re-embedded by the background re-indexer",
+    ["result"]
+)
+
+SHED_REQUESTS = Counter(
+    "health_ai_shed_requests_total",
+    "Requests rejected with 503 because their estimated work exceeded the remaining deadline",
+    ["endpoint"]
+)
+
+ABORTED_REQUESTS = Counter(
+    "health_ai_aborted_requests_total",
+    "Requests abandoned mid-processing by reason (deadline/disconnected)",
+    ["endpoint", "reason"]
+)
+
+WASTED_COMPUTE_SECONDS = Counter(
+    "health_ai_wasted_compute_seconds_total",
+    "Processing time spent on results nobody received (deadline/disconnected/late)",
+    ["endpoint", "reason"]
+)
+
+WORK_SECONDS_PER_UNIT = Gauge(
+    "health_ai_work_seconds_per_unit",
+    "Moving average of processing seconds per page or chunk, used for load shedding",
+    ["operation"]
+)
+
+# Processing stages, kept in one place so dashboards match the code
+STAGE_PDF_TEXT = "pdf_text_extraction"
+STAGE_PAGE_RENDER = "page_render"
+STAGE_TESSERACT = "tesseract"
+STAGE_NER_FORWARD = "ner_forward"
+STAGE_WORDPIECE_MERGE = "wordpiece_merge"
+STAGE_EMBEDDING_ENCODE = "embedding_encode"
+STAGE_SIMILARITY = "similarity"
+STAGE_LEXICAL_SEARCH = "lexical_search"
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a block of work and record it under the given stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def observe_model_load(model: str):
+    """Record how long loading a model takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.labels(model=model).set(elapsed)
+        logger.info(f"Loaded {model} in {elapsed:.2f}s")
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Return the current metrics in Prometheus text format with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
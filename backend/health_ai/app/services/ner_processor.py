@@ -1,5 +1,6 @@
 # health_ai/app/services/ner_processor.py
 import time
+import traceback
 from typing import List, Dict, Any
 import logging
 from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
@@ -7,34 +8,42 @@ import os
 from dotenv import load_dotenv
 from huggingface_hub import login
 import numpy as np
+from starlette.concurrency import run_in_threadpool
+from .metrics import observe_stage, observe_model_load, STAGE_NER_FORWARD, STAGE_WORDPIECE_MERGE
+from .deadline import Deadline, RequestAborted
 
 logger = logging.getLogger(__name__)
 
 class NERProcessor:
+    max_chunk_length = 400  # Characters per model call, lower than model max to be safe
+    
     def __init__(self):
         load_dotenv() 
-        hf_token = os.getenv("HUGGINGFACE_TOKEN")
-        if not hf_token:
-            raise ValueError("HUGGINGFACEHUB_API_TOKEN not set in .env")
+        # In offline mode (benchmarks, air-gapped hosts) models come from the local cache
+        if os.getenv("HF_HUB_OFFLINE") != "1":
+            hf_token = os.getenv("HUGGINGFACE_TOKEN")
+            if not hf_token:
+                raise ValueError("HUGGINGFACEHUB_API_TOKEN not set in .env")
 
-        login(token=hf_token)
+            login(token=hf_token)
 
         self.model_name = "d4data/biomedical-ner-all"
         
         try:
             logger.info(f"Loading medical NER model {self.model_name}...")
             
-            # Load tokenizer and model
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
-            
-            # Create NER pipeline
-            self.ner_pipeline = pipeline(
-                "ner", 
-                model=self.model, 
-                tokenizer=self.tokenizer,
-                aggregation_strategy="simple"
-            )
+            with observe_model_load("ner"):
+                # Load tokenizer and model
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
+                
+                # Create NER pipeline
+                self.ner_pipeline = pipeline(
+                    "ner", 
+                    model=self.model, 
+                    tokenizer=self.tokenizer,
+                    aggregation_strategy="simple"
+                )
             
             logger.info("Medical NER model loaded successfully")
             
@@ -105,45 +114,62 @@ class NERProcessor:
                 "end": int(entity["end"]) if isinstance(entity["end"], np.integer) else entity["end"]
             })
         return processed
+    
+    def _split_chunks(self, text: str) -> List[str]:
+        """Split long text into chunks to avoid context length issues"""
+        return [text[i:i + self.max_chunk_length] for i in range(0, len(text), self.max_chunk_length)]
+    
+    def count_chunks(self, text: str) -> int:
+        """Number of model calls needed for the text, used to estimate the work of a request"""
+        return len(self._split_chunks(text))
+    
+    def _extract_model_entities(self, text: str, deadline: Deadline) -> List[Dict[str, Any]]:
+        """Run the transformer model chunk by chunk, stopping between chunks on deadline"""
+        chunks = self._split_chunks(text)
+        
+        # Process each chunk
+        all_entities = []
+        offset = 0
+        for chunk_num, chunk in enumerate(chunks):
+            deadline.check(f"before NER chunk {chunk_num + 1} of {len(chunks)}")
+            with observe_stage(STAGE_NER_FORWARD):
+                chunk_entities = self.ner_pipeline(chunk)
+            # Adjust start/end positions by offset
+            for entity in chunk_entities:
+                entity["start"] += offset
+                entity["end"] += offset
+            all_entities.extend(chunk_entities)
+            offset += len(chunk)
+        
+        # Convert to our format
+        entities = self._process_model_entities(all_entities)
+        
+        # Apply token merging
+        with observe_stage(STAGE_WORDPIECE_MERGE):
+            entities = self._merge_wordpiece_tokens(entities)
+        
+        # Apply medical domain post-processing
+        return self._post_process_entities(entities)
 
-    async def extract_entities(self, text: str) -> Dict[str, Any]:
-        """Extract medical entities from text"""
+    async def extract_entities(self, text: str, deadline: Deadline = None) -> Dict[str, Any]:
+        """Extract medical entities from text.
+
+        Raises RequestAborted when ``deadline`` expires or is cancelled.
+        """
         start_time = time.time()
+        deadline = deadline or Deadline()
         
         try:
             if hasattr(self, "is_rule_based"):
                 # Use rule-based extraction
                 entities = self._extract_rule_based_entities(text)
             else:
-                # Use transformer model - with chunking for long texts
+                # Use transformer model - with chunking for long texts, off the event loop
                 try:
-                    # Split long text into chunks to avoid context length issues
-                    max_length = 400  # Lower than model max to be safe
-                    chunks = []
-                    for i in range(0, len(text), max_length):
-                        chunks.append(text[i:i+max_length])
-                    
-                    # Process each chunk
-                    all_entities = []
-                    offset = 0
-                    for chunk in chunks:
-                        chunk_entities = self.ner_pipeline(chunk)
-                        # Adjust start/end positions by offset
-                        for entity in chunk_entities:
-                            entity["start"] += offset
-                            entity["end"] += offset
-                        all_entities.extend(chunk_entities)
-                        offset += len(chunk)
-                
-                    # Convert to our format
-                    entities = self._process_model_entities(all_entities)
-                
-                    # Apply token merging
-                    entities = self._merge_wordpiece_tokens(entities)
-                
-                    # Apply medical domain post-processing
-                    entities = self._post_process_entities(entities)
+                    entities = await run_in_threadpool(self._extract_model_entities, text, deadline)
                 
+                except RequestAborted:
+                    raise
                 except Exception as model_error:
                     logger.error(f"Error using model for NER: {model_error}")
                     logger.error(traceback.format_exc())
@@ -171,6 +197,8 @@ class NERProcessor:
                 "processing_time": round(processing_time, 2)
             }
         
+        except RequestAborted:
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             logger.error(f"Entity extraction failed: {e}")
@@ -1,11 +1,23 @@
 import io
+import abc
 import time
+import asyncio
+import ctypes
+import ctypes.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 import re
 import logging
 import os  # Missing import for os
+from typing import Union
+from .metrics import (
+    observe_stage, observe_model_load, OCR_BACKLOG,
+    STAGE_PDF_TEXT, STAGE_PAGE_RENDER, STAGE_TESSERACT
+)
+from .deadline import Deadline, RequestAborted
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +33,234 @@ for path in TESSERACT_PATHS:
         pytesseract.pytesseract.tesseract_cmd = path
         break
 
+# Shared library locations for the in-process engine (same layout as above)
+TESSERACT_LIB_PATHS = [
+    "/opt/homebrew/lib/libtesseract.dylib",  # Apple Silicon Homebrew
+    "/usr/local/lib/libtesseract.dylib",     # Intel Homebrew
+    "/usr/lib/x86_64-linux-gnu/libtesseract.so.5",
+    "/usr/lib/aarch64-linux-gnu/libtesseract.so.5",
+    "/usr/lib/libtesseract.so.5"
+]
+
+# Tesseract enums used by the C API (see tesseract/publictypes.h)
+OEM_DEFAULT = 3
+PSM_SINGLE_BLOCK = 6
+
+# Character whitelist used for uploaded images
+IMAGE_CHAR_WHITELIST = r'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,/:;()[]{}+-=<>%$@#&*!?"\' '
+
+
+class OCRBackend(abc.ABC):
+    """Interface for OCR engines used by OCRProcessor.
+
+    ``recognize`` receives a raw, tightly described pixel buffer so that
+    callers can hand over PyMuPDF pixmaps without encoding them first.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def recognize(self, data, width: int, height: int, bytes_per_pixel: int,
+                  bytes_per_line: int, whitelist: str = None, dpi: int = None) -> str:
+        """Recognise the text in a raw pixel buffer"""
+
+    def recognize_pixmap(self, pix, whitelist: str = None, dpi: int = None) -> str:
+        """Run OCR over a PyMuPDF pixmap"""
+        return self.recognize(pix.samples_mv, pix.width, pix.height, pix.n,
+                              pix.stride, whitelist=whitelist, dpi=dpi)
+
+    def recognize_image(self, img: Image.Image, whitelist: str = None) -> str:
+        """Run OCR over a PIL image (converted to RGB)"""
+        img = img.convert("RGB")
+        return self.recognize(img.tobytes(), img.width, img.height, 3,
+                              img.width * 3, whitelist=whitelist)
+
+    def close(self):
+        """Release engine resources at shutdown"""
+
+
+class PytesseractBackend(OCRBackend):
+    """Fallback backend that shells out to the tesseract binary for every call"""
+
+    name = "pytesseract"
+
+    def recognize(self, data, width, height, bytes_per_pixel, bytes_per_line,
+                  whitelist=None, dpi=None):
+        mode = {1: "L", 3: "RGB", 4: "RGBA"}[bytes_per_pixel]
+        img = Image.frombuffer(mode, (width, height), data, "raw", mode, bytes_per_line, 1)
+        config = f'--oem {OEM_DEFAULT} --psm {PSM_SINGLE_BLOCK}'
+        if dpi:
+            config += f' --dpi {dpi}'
+        if whitelist:
+            config += f' -c tessedit_char_whitelist={whitelist}'
+        return pytesseract.image_to_string(img, config=config)
+
+
+class TesseractCAPIBackend(OCRBackend):
+    """In-process backend that talks to libtesseract through its C API.
+
+    Each worker thread keeps its own initialised TessBaseAPI handle, so
+    language data is loaded once per thread instead of once per page, and
+    pixmaps are passed to tesseract by pointer without any copy or PNG
+    round-trip.
+    """
+
+    name = "tesseract-capi"
+
+    def __init__(self, language: str = "eng", datapath: str = None, lib_path: str = None):
+        self.language = language
+        self.datapath = datapath or os.getenv("TESSDATA_PREFIX")
+        self.lib = self._load_library(lib_path)
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+        # Fail fast if the language data cannot be loaded; the check runs on
+        # the importing thread, which never does OCR, so its engine is freed
+        self._free_handle(self._create_handle())
+
+    @staticmethod
+    def _load_library(lib_path: str = None):
+        candidates = [lib_path] if lib_path else []
+        found = ctypes.util.find_library("tesseract")
+        if found:
+            candidates.append(found)
+        candidates.extend(TESSERACT_LIB_PATHS)
+
+        for candidate in candidates:
+            if not candidate:
+                continue
+            try:
+                lib = ctypes.CDLL(candidate)
+                break
+            except OSError:
+                continue
+        else:
+            raise OSError("libtesseract shared library not found")
+
+        lib.TessBaseAPICreate.restype = ctypes.c_void_p
+        lib.TessBaseAPIInit2.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        lib.TessBaseAPIInit2.restype = ctypes.c_int
+        lib.TessBaseAPISetPageSegMode.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessBaseAPISetVariable.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.TessBaseAPISetVariable.restype = ctypes.c_int
+        lib.TessBaseAPISetImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int,
+                                            ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.TessBaseAPISetSourceResolution.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        # Returned as a raw pointer so it can be released with TessDeleteText
+        lib.TessBaseAPIGetUTF8Text.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+        lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIClear.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIEnd.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIDelete.argtypes = [ctypes.c_void_p]
+        return lib
+
+    def _create_handle(self):
+        handle = self.lib.TessBaseAPICreate()
+        datapath = self.datapath.encode() if self.datapath else None
+        if self.lib.TessBaseAPIInit2(handle, datapath, self.language.encode(), OEM_DEFAULT) != 0:
+            self.lib.TessBaseAPIDelete(handle)
+            raise RuntimeError(f"Could not initialise tesseract for language '{self.language}'")
+        self.lib.TessBaseAPISetPageSegMode(handle, PSM_SINGLE_BLOCK)
+        return handle
+
+    def _free_handle(self, handle):
+        self.lib.TessBaseAPIEnd(handle)
+        self.lib.TessBaseAPIDelete(handle)
+
+    def _get_handle(self):
+        """Return this thread's warm engine, creating it on first use"""
+        handle = getattr(self._local, "handle", None)
+        if handle is not None:
+            return handle
+
+        handle = self._create_handle()
+        self._local.handle = handle
+        with self._handles_lock:
+            self._handles.append(handle)
+        logger.info(f"Initialised in-process tesseract engine on {threading.current_thread().name}")
+        return handle
+
+    def recognize(self, data, width, height, bytes_per_pixel, bytes_per_line,
+                  whitelist=None, dpi=None):
+        handle = self._get_handle()
+        self.lib.TessBaseAPISetVariable(handle, b"tessedit_char_whitelist",
+                                        (whitelist or "").encode())
+
+        if not isinstance(data, (int, bytes)):
+            # ctypes can only borrow pointers from bytes or raw addresses
+            data = bytes(data)
+
+        try:
+            self.lib.TessBaseAPISetImage(handle, data, width, height, bytes_per_pixel, bytes_per_line)
+            if dpi:
+                self.lib.TessBaseAPISetSourceResolution(handle, dpi)
+            text_ptr = self.lib.TessBaseAPIGetUTF8Text(handle)
+            if not text_ptr:
+                return ""
+            try:
+                return ctypes.string_at(text_ptr).decode("utf-8", errors="replace")
+            finally:
+                self.lib.TessDeleteText(text_ptr)
+        finally:
+            # Drop the image reference so tesseract never holds on to our buffer
+            self.lib.TessBaseAPIClear(handle)
+
+    def recognize_pixmap(self, pix, whitelist=None, dpi=None):
+        # samples_ptr points straight at MuPDF's pixel memory
+        return self.recognize(pix.samples_ptr, pix.width, pix.height, pix.n,
+                              pix.stride, whitelist=whitelist, dpi=dpi)
+
+    def close(self):
+        with self._handles_lock:
+            for handle in self._handles:
+                self._free_handle(handle)
+            self._handles = []
+        self._local = threading.local()
+
+
+def create_ocr_backend(name: str = None) -> OCRBackend:
+    """Create the configured OCR backend, falling back to pytesseract.
+
+    ``name`` (or the OCR_BACKEND env var) may be "auto", "tesseract-capi"
+    or "pytesseract".
+    """
+    name = (name or os.getenv("OCR_BACKEND", "auto")).lower()
+
+    if name in ("auto", "tesseract-capi"):
+        try:
+            return TesseractCAPIBackend(language=os.getenv("OCR_LANGUAGE", "eng"))
+        except Exception as e:
+            if name != "auto":
+                raise
+            logger.warning(f"In-process tesseract unavailable ({e}), using pytesseract")
+
+    return PytesseractBackend()
+
+
 class OCRProcessor:
-    def __init__(self):
+    render_dpi = 300  # Resolution used when rasterising pages for OCR
+
+    def __init__(self, backend: OCRBackend = None):
         self.min_text_threshold = 50  # Minimum characters to skip OCR
+        if backend is None:
+            with observe_model_load("ocr"):
+                backend = create_ocr_backend()
+        self.backend = backend
+        # OCR runs off the event loop; the pool size also bounds the number
+        # of per-thread Tesseract engines
+        self.workers = int(os.getenv("OCR_WORKERS", "2"))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        # Jobs and pages submitted to the pool and not finished yet
+        self._backlog_jobs = 0
+        self._backlog_pages = 0
+        self._backlog_lock = threading.Lock()
+        logger.info(f"Using OCR backend: {self.backend.name}")
+    
+    def close(self):
+        """Wait for running OCR work, then release the backend's engines"""
+        self.executor.shutdown(wait=True)
+        self.backend.close()
         
     def clean_text(self, text: str) -> str:
         """Clean and normalize extracted text"""
@@ -35,75 +272,154 @@ class OCRProcessor:
         text = re.sub(r'\n{3,}', '\n\n', text)
         return text.strip()
     
-    def extract_from_pdf(self, pdf_bytes: bytes) -> tuple[str, int]:
+    def _open_pdf(self, pdf_source: Union[bytes, str]) -> fitz.Document:
+        """Open a PDF from bytes or, preferably, from a local path.
+
+        When given a path MuPDF reads the file on demand instead of holding
+        the whole document in a Python bytes object.
+        """
+        if isinstance(pdf_source, str):
+            return fitz.open(pdf_source, filetype="pdf")
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    
+    def _is_pdf(self, filename: str, mime_type: str) -> bool:
+        return mime_type == "application/pdf" or filename.lower().endswith('.pdf')
+    
+    def _is_image(self, filename: str, mime_type: str) -> bool:
+        return mime_type.startswith('image/') or any(filename.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp'])
+    
+    def count_pages(self, file_content: Union[bytes, str], filename: str, mime_type: str) -> int:
+        """Number of pages that will be processed, used to estimate the work of a request"""
+        if self._is_image(filename, mime_type) and not self._is_pdf(filename, mime_type):
+            return 1
+        try:
+            with self._open_pdf(file_content) as doc:
+                return len(doc)
+        except Exception:
+            return 1
+    
+    def queued_pages(self) -> float:
+        """Roughly how many pages of earlier jobs a new job waits for before it
+        starts: the backlog spread over the workers, 0 while a worker is free"""
+        with self._backlog_lock:
+            if self._backlog_jobs < self.workers:
+                return 0.0
+            return self._backlog_pages / self.workers
+    
+    def _finish_job(self, pages: int):
+        with self._backlog_lock:
+            self._backlog_jobs -= 1
+            self._backlog_pages -= pages
+        OCR_BACKLOG.dec()
+    
+    def extract_from_pdf(self, pdf_source: Union[bytes, str], deadline: Deadline = None) -> tuple[str, int]:
         """Extract text from PDF using PyMuPDF, fallback to OCR for image-heavy pages"""
+        deadline = deadline or Deadline()
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            all_text = []
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # First try direct text extraction
-                page_text = page.get_text().strip()
+            with self._open_pdf(pdf_source) as doc:
+                all_text = []
                 
-                # If page has little text, it might be an image - use OCR
-                if len(page_text) < self.min_text_threshold:
-                    logger.info(f"Page {page_num + 1} has little text, running OCR...")
+                for page_num in range(len(doc)):
+                    # Stop between pages once nobody is waiting for the result
+                    deadline.check(f"before page {page_num + 1} of {len(doc)}")
+                    page = doc[page_num]
                     
-                    # Render page as image
-                    pix = page.get_pixmap(dpi=300, alpha=False)
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                    # First try direct text extraction
+                    with observe_stage(STAGE_PDF_TEXT):
+                        page_text = page.get_text().strip()
                     
-                    # Run OCR
-                    ocr_text = pytesseract.image_to_string(img, config='--oem 3 --psm 6')
-                    page_text = ocr_text.strip()
-                
-                all_text.append(page_text)
-            
-            doc.close()
+                    # If page has little text, it might be an image - use OCR
+                    if len(page_text) < self.min_text_threshold:
+                        logger.info(f"Page {page_num + 1} has little text, running OCR...")
+                        
+                        # Render page as image
+                        with observe_stage(STAGE_PAGE_RENDER):
+                            pix = page.get_pixmap(dpi=self.render_dpi, alpha=False)
+                        
+                        # Run OCR directly on the pixmap buffer
+                        with observe_stage(STAGE_TESSERACT):
+                            ocr_text = self.backend.recognize_pixmap(pix, dpi=self.render_dpi)
+                        page_text = ocr_text.strip()
+                    
+                    all_text.append(page_text)
             
             # Combine all pages
             combined_text = self.clean_text('\n\n--- PAGE BREAK ---\n\n'.join(all_text))
             return combined_text, len(all_text)
             
+        except RequestAborted:
+            raise
         except Exception as e:
             logger.error(f"PDF extraction failed: {e}")
             raise
     
-    def extract_from_image(self, image_bytes: bytes) -> str:
-        """Extract text from image using Tesseract OCR"""
+    def extract_from_image(self, image_source: Union[bytes, str]) -> str:
+        """Extract text from image (bytes or local path) using Tesseract OCR"""
         try:
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            
-            # Use Tesseract with medical-optimized config
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,/:;()[]{}+-=<>%$@#&*!?"\' '
+            if isinstance(image_source, str):
+                img = Image.open(image_source).convert("RGB")
+            else:
+                img = Image.open(io.BytesIO(image_source)).convert("RGB")
             
-            text = pytesseract.image_to_string(img, config=custom_config)
+            # Use Tesseract with medical-optimized whitelist
+            with observe_stage(STAGE_TESSERACT):
+                text = self.backend.recognize_image(img, whitelist=IMAGE_CHAR_WHITELIST)
             return self.clean_text(text)
             
         except Exception as e:
             logger.error(f"Image OCR failed: {e}")
             raise
     
-    async def process_file(self, file_content: bytes, filename: str, mime_type: str) -> dict:
-        """Main processing function"""
+    def _extract(self, file_content: Union[bytes, str], filename: str, mime_type: str,
+                 deadline: Deadline) -> tuple[str, int]:
+        """Determine file type and extract text accordingly"""
+        if self._is_pdf(filename, mime_type):
+            return self.extract_from_pdf(file_content, deadline)
+        if self._is_image(filename, mime_type):
+            deadline.check("before OCR")
+            return self.extract_from_image(file_content), 1
+        # Try PDF first, fallback to image
+        try:
+            return self.extract_from_pdf(file_content, deadline)
+        except RequestAborted:
+            raise
+        except Exception:
+            return self.extract_from_image(file_content), 1
+    
+    async def process_path(self, path: str, filename: str, mime_type: str,
+                           deadline: Deadline = None, pages: int = 1) -> dict:
+        """Process a document that is already on local disk"""
+        return await self.process_file(path, filename, mime_type, deadline, pages)
+    
+    async def process_file(self, file_content: Union[bytes, str], filename: str, mime_type: str,
+                           deadline: Deadline = None, pages: int = 1) -> dict:
+        """Main processing function, accepts raw bytes or a local file path.
+
+        ``pages`` is the expected page count (see count_pages), used to track
+        the backlog of the OCR pool. The result's ``queue_time`` is the time
+        spent waiting for a free OCR worker. Raises RequestAborted when
+        ``deadline`` expires or is cancelled.
+        """
         start_time = time.time()
         
+        def run():
+            started = time.time()
+            return self._extract(file_content, filename, mime_type, deadline or Deadline()), started
+        
         try:
-            # Determine file type and process accordingly
-            if mime_type == "application/pdf" or filename.lower().endswith('.pdf'):
-                text, pages = self.extract_from_pdf(file_content)
-            elif mime_type.startswith('image/') or any(filename.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']):
-                text = self.extract_from_image(file_content)
-                pages = 1
-            else:
-                # Try PDF first, fallback to image
-                try:
-                    text, pages = self.extract_from_pdf(file_content)
-                except:
-                    text = self.extract_from_image(file_content)
-                    pages = 1
+            with self._backlog_lock:
+                self._backlog_jobs += 1
+                self._backlog_pages += pages
+            OCR_BACKLOG.inc()
+            try:
+                job = self.executor.submit(run)
+            except Exception:
+                self._finish_job(pages)
+                raise
+            # Counted until the job finishes, even if the awaiting request goes away first
+            job.add_done_callback(lambda _: self._finish_job(pages))
+            (text, page_count), started = await asyncio.wrap_future(job)
+            queue_time = started - start_time
             
             processing_time = time.time() - start_time
             
@@ -113,11 +429,14 @@ class OCRProcessor:
             return {
                 "success": True,
                 "text": text,
-                "pages": pages,
+                "pages": page_count,
                 "char_count": len(text),
-                "processing_time": round(processing_time, 2)
+                "processing_time": round(processing_time, 2),
+                "queue_time": round(queue_time, 2)
             }
             
+        except RequestAborted:
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             logger.error(f"OCR processing failed: {e}")
@@ -0,0 +1,102 @@
+# health_ai/app/services/profiler.py
+import os
+import sys
+import time
+import threading
+import logging
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Innermost Python frames of threads that are blocked waiting, not working:
+# idle pool workers, the event loop in select(), condition/event waits
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),     # concurrent.futures worker between jobs
+    ("selectors.py", "select"),
+}
+
+
+class SamplingProfiler:
+    """Low-overhead sampling profiler for capturing hot paths in production.
+
+    A background thread snapshots the stacks of all other threads at a fixed
+    interval and counts them. The result is emitted in the folded-stack
+    format understood by flamegraph.pl and speedscope. Threads that are
+    parked in a wait (see IDLE_FRAMES) are skipped unless ``include_idle``
+    is set, so the graph shows where work happens rather than where idle
+    workers sleep.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._samples = Counter()
+        self._started_at = None
+        self.interval = 0.01
+        self.include_idle = False
+        self.idle_samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, include_idle: bool = False) -> bool:
+        """Start sampling; returns False if already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self.include_idle = include_idle
+            self._samples = Counter()
+            self.idle_samples = 0
+            self._stop.clear()
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({interval * 1000:.0f}ms interval)")
+        return True
+
+    def stop(self) -> str:
+        """Stop sampling and return the collected folded stacks"""
+        with self._lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+                self._thread = None
+                logger.info(f"Sampling profiler stopped after {time.time() - self._started_at:.1f}s "
+                            f"({sum(self._samples.values())} samples, {self.idle_samples} idle skipped)")
+            return self.folded()
+
+    def folded(self) -> str:
+        """Render samples as 'frame;frame;frame count' lines"""
+        return "\n".join(f"{stack} {count}" for stack, count in self._samples.most_common())
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if not self.include_idle and self._is_idle(frame):
+                    self.idle_samples += 1
+                    continue
+                self._samples[self._fold(frame)] += 1
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        code = frame.f_code
+        return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+    @staticmethod
+    def _fold(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_filename}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
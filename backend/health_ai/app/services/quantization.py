@@ -0,0 +1,234 @@
+# health_ai/app/services/quantization.py
+import base64
+from typing import List, Dict, Any, Optional
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Float32Codec:
+    """Uncompressed baseline: vectors are kept as float32"""
+
+    name = "none"
+
+    def encode(self, vector: np.ndarray):
+        return np.asarray(vector, dtype=np.float32)
+
+    def stack(self, encoded: List[Any]):
+        return np.stack(encoded)
+
+    def scores(self, query: np.ndarray, stacked) -> np.ndarray:
+        return stacked @ query
+
+    def nbytes(self, encoded) -> int:
+        return encoded.nbytes
+
+    def take(self, stacked, rows) -> np.ndarray:
+        return stacked[rows]
+
+    def concat(self, parts: List[Any]) -> np.ndarray:
+        return np.concatenate(parts)
+
+    def stacked_nbytes(self, stacked) -> int:
+        return stacked.nbytes
+
+
+class Int8Codec:
+    """Symmetric per-vector int8 scalar quantization (4x smaller than float32).
+
+    Each vector is stored as int8 codes plus one float scale. Queries stay in
+    float32 and are scored directly against the codes (asymmetric distance).
+    """
+
+    name = "int8"
+    # Codes are converted to float32 for scoring this many rows at a time,
+    # so a full scan never holds a float32 copy of the whole index
+    score_block_rows = 4096
+
+    def encode(self, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        peak = float(np.abs(vector).max())
+        scale = peak / 127 if peak > 0 else 1.0
+        codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return codes, np.float32(scale)
+
+    def decode(self, encoded) -> np.ndarray:
+        codes, scale = encoded
+        return codes.astype(np.float32) * scale
+
+    def stack(self, encoded: List[Any]):
+        return np.stack([codes for codes, _ in encoded]), np.array([scale for _, scale in encoded], dtype=np.float32)
+
+    def scores(self, query: np.ndarray, stacked) -> np.ndarray:
+        codes, scales = stacked
+        query = np.asarray(query, dtype=np.float32)
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.score_block_rows):
+            block = codes[start:start + self.score_block_rows]
+            result[start:start + len(block)] = block.astype(np.float32) @ query
+        return result * scales
+
+    def nbytes(self, encoded) -> int:
+        codes, scale = encoded
+        return codes.nbytes + scale.nbytes
+
+    def take(self, stacked, rows):
+        codes, scales = stacked
+        return codes[rows], scales[rows]
+
+    def concat(self, parts: List[Any]):
+        return np.concatenate([codes for codes, _ in parts]), np.concatenate([scales for _, scales in parts])
+
+    def stacked_nbytes(self, stacked) -> int:
+        codes, scales = stacked
+        return codes.nbytes + scales.nbytes
+
+    def to_base64(self, vector) -> Dict[str, Any]:
+        """Compact JSON form for storage, e.g. in Mongo"""
+        codes, scale = self.encode(vector)
+        return {"codes": base64.b64encode(codes.tobytes()).decode("ascii"), "scale": float(scale)}
+
+    def from_base64(self, codes: str, scale: float):
+        return np.frombuffer(base64.b64decode(codes), dtype=np.int8), np.float32(scale)
+
+
+class ProductQuantizer:
+    """Product quantization with asymmetric distance computation (ADC).
+
+    Vectors are split into ``subspaces`` slices and each slice is replaced
+    by the id of its nearest centroid (one byte with 256 centroids), so a
+    384-dim float32 vector (1536 bytes) becomes 48 bytes by default. At
+    search time the query is compared once against every centroid and each
+    stored vector's score is a sum of table lookups.
+    """
+
+    name = "pq"
+
+    def __init__(self, subspaces: int = 48, centroids: int = 256, codebook: Optional[np.ndarray] = None):
+        if centroids > 256:
+            raise ValueError("at most 256 centroids fit in a uint8 code")
+        self.subspaces = subspaces
+        self.centroids = centroids
+        # (subspaces, centroids, subspace_dim)
+        self.codebook = codebook
+
+    @property
+    def trained(self) -> bool:
+        return self.codebook is not None
+
+    @property
+    def dimensions(self):
+        """Vector length the codebook was trained for"""
+        return self.codebook.shape[0] * self.codebook.shape[2] if self.trained else None
+
+    def fit(self, vectors: np.ndarray, iterations: int = 20, seed: int = 0) -> "ProductQuantizer":
+        """Train one k-means codebook per subspace"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count, dim = vectors.shape
+        if dim % self.subspaces:
+            raise ValueError(f"dimension {dim} is not divisible by {self.subspaces} subspaces")
+        if count < self.centroids:
+            raise ValueError(f"need at least {self.centroids} training vectors, got {count}")
+
+        rng = np.random.default_rng(seed)
+        sub_dim = dim // self.subspaces
+        codebook = np.empty((self.subspaces, self.centroids, sub_dim), dtype=np.float32)
+
+        for s in range(self.subspaces):
+            data = vectors[:, s * sub_dim:(s + 1) * sub_dim]
+            centers = data[rng.choice(count, self.centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = self._nearest(data, centers)
+                counts = np.bincount(assignment, minlength=self.centroids)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assignment, data)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty clusters from random points
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    centers[empty] = data[rng.integers(count, size=len(empty))]
+            codebook[s] = centers
+
+        self.codebook = codebook
+        logger.info(f"Trained PQ codebook: {self.subspaces} subspaces x {self.centroids} centroids on {count} vectors")
+        return self
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2 * data @ centers.T
+            + (centers ** 2).sum(axis=1)
+        )
+        return distances.argmin(axis=1)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        count = vectors.shape[0]
+        return vectors.reshape(count, self.subspaces, -1)
+
+    def encode_batch(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.empty((vectors.shape[0], self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            codes[:, s] = self._nearest(vectors[:, s], self.codebook[s])
+        return codes
+
+    def encode(self, vector: np.ndarray) -> np.ndarray:
+        return self.encode_batch(np.asarray(vector, dtype=np.float32)[None, :])[0]
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate([self.codebook[s][codes[s]] for s in range(self.subspaces)])
+
+    def stack(self, encoded: List[np.ndarray]) -> np.ndarray:
+        return np.stack(encoded)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Lookup table of query-slice x centroid inner products: (subspaces, centroids)
+        table = np.einsum("sd,scd->sc", self._split(np.asarray(query, dtype=np.float32)[None, :])[0], self.codebook)
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
+
+    def nbytes(self, encoded: np.ndarray) -> int:
+        return encoded.nbytes
+
+    def take(self, stacked: np.ndarray, rows) -> np.ndarray:
+        return stacked[rows]
+
+    def concat(self, parts: List[np.ndarray]) -> np.ndarray:
+        return np.concatenate(parts)
+
+    def stacked_nbytes(self, stacked: np.ndarray) -> int:
+        return stacked.nbytes
+
+    def save(self, path: str):
+        np.save(path, self.codebook)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductQuantizer":
+        codebook = np.load(path)
+        return cls(subspaces=codebook.shape[0], centroids=codebook.shape[1], codebook=codebook)
+
+
+def create_codec(name: str, codebook_path: Optional[str] = None):
+    """Build the vector codec for the search index ("none", "int8" or "pq")"""
+    name = (name or "none").lower()
+    if name == "int8":
+        return Int8Codec()
+    if name == "pq":
+        if codebook_path:
+            try:
+                return ProductQuantizer.load(codebook_path)
+            except Exception as e:
+                logger.warning(f"Could not load PQ codebook from {codebook_path}: {e}")
+        logger.warning("PQ compression needs a trained codebook (PQ_CODEBOOK_PATH), using int8")
+        return Int8Codec()
+    return Float32Codec()
+
+
+def recall_at_k(exact_scores: np.ndarray, approx_scores: np.ndarray, k: int) -> float:
+    """Mean overlap of the approximate top-k with the exact top-k, per query row"""
+    exact = np.argsort(-exact_scores, axis=1)[:, :k]
+    approx = np.argsort(-approx_scores, axis=1)[:, :k]
+    overlaps = [len(set(e) & set(a)) / k for e, a in zip(exact, approx)]
+    return float(np.mean(overlaps))
@@ -0,0 +1,172 @@
+# health_ai/app/services/reindexer.py
+import asyncio
+import time
+from typing import Callable, Dict, Any, List, Optional
+import logging
+from starlette.concurrency import run_in_threadpool
+from .embedding_service import EmbeddingService
+from .search_index import HybridSearchIndex
+from .metrics import REINDEX_STALE_REPORTS, REINDEXED_REPORTS
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundReindexer:
+    """Re-embeds reports indexed with an older embedding version.
+
+    Runs as a background task on the event loop. It only works while
+    ``is_busy()`` is false, handles ``batch_size`` reports at a time with
+    the encoding done in a worker thread, and sleeps ``pause`` seconds
+    between batches, so user-facing requests keep their latency.
+    Old vectors stay searchable until a user's reports are all upgraded
+    (see HybridSearchIndex.search_plan).
+
+    Upgraded reports are kept, with their new vectors, until the backend
+    has stored them (``pending_upgrades`` / ``acknowledge``), so a restart
+    does not fall back to the old vectors. Re-indexing pauses while
+    ``max_pending`` upgrades wait to be stored.
+    """
+
+    def __init__(self, index: HybridSearchIndex, embedding_service: EmbeddingService,
+                 is_busy: Callable[[], bool], batch_size: int = 4, pause: float = 1.0,
+                 idle_poll: float = 10.0, max_pending: int = 100):
+        self.index = index
+        self.embedding_service = embedding_service
+        self.is_busy = is_busy
+        self.batch_size = batch_size
+        self.pause = pause
+        self.idle_poll = idle_poll
+        self.max_pending = max_pending
+        self._task: Optional[asyncio.Task] = None
+        # Reports that could not be upgraded; retried after a restart
+        self._skipped = set()
+        # (user_id, report_id) -> upgraded chunks and vectors not yet stored by the backend
+        self._upgraded: Dict[tuple, Dict[str, Any]] = {}
+        self.reindexed = 0
+        self.failed = 0
+        self.last_error = None
+        self.last_batch_at = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Background re-indexer started for {self.embedding_service.version}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        stale = self.index.stale_count(self.embedding_service.version)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "current_version": self.embedding_service.version,
+            "stale_reports": stale,
+            "reindexed_reports": self.reindexed,
+            "failed_reports": self.failed,
+            "skipped_reports": len(self._skipped),
+            "pending_upgrades": len(self._upgraded),
+            "last_batch_at": self.last_batch_at,
+            "last_error": self.last_error
+        }
+
+    async def _run(self):
+        version = self.embedding_service.version
+        while True:
+            try:
+                REINDEX_STALE_REPORTS.set(self.index.stale_count(version))
+                if self.is_busy():
+                    await asyncio.sleep(self.pause)
+                    continue
+                if len(self._upgraded) >= self.max_pending:
+                    # Wait for the backend to store what was upgraded so far
+                    await asyncio.sleep(self.idle_poll)
+                    continue
+
+                batch = [
+                    report for report in self.index.stale_reports(version, self.batch_size + len(self._skipped))
+                    if (report["user_id"], report["report_id"]) not in self._skipped
+                ][:self.batch_size]
+                if not batch:
+                    await asyncio.sleep(self.idle_poll)
+                    continue
+
+                for report in batch:
+                    await self._reindex(report, version)
+                self.last_batch_at = time.time()
+                await asyncio.sleep(self.pause)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Re-indexing batch failed: {e}")
+                await asyncio.sleep(self.idle_poll)
+
+    def pending_upgrades(self, limit: int) -> List[Dict[str, Any]]:
+        """Upgraded reports the backend has not stored yet, skipping (and
+        forgetting) reports removed or re-indexed since their upgrade"""
+        pending = []
+        for (user_id, report_id), upgrade in list(self._upgraded.items()):
+            if self.index.generation(user_id, report_id) != upgrade["generation"]:
+                self._upgraded.pop((user_id, report_id), None)
+                continue
+            pending.append({"user_id": user_id, "report_id": report_id, **upgrade})
+            if len(pending) >= limit:
+                break
+        return pending
+
+    def acknowledge(self, user_id: str, report_id: str, generation: int) -> bool:
+        """Forget an upgrade once the backend has stored it"""
+        upgrade = self._upgraded.get((user_id, report_id))
+        if upgrade is None or upgrade["generation"] != generation:
+            return False
+        del self._upgraded[(user_id, report_id)]
+        return True
+
+    def _chunks_for(self, report: Dict[str, Any]):
+        """Chunks to embed for the current version"""
+        if report["text"]:
+            return self.embedding_service._split_text(report["text"])
+
+        # No source text (e.g. reloaded from storage without it): embed the old chunks
+        # as they are. Consecutive chunks overlap, so re-chunking their concatenation
+        # would duplicate the overlaps.
+        current_chunker = self.embedding_service.version.split("@", 1)[1]
+        old_chunks = self.index.report_chunks(report["user_id"], report["report_id"])
+        for version, chunks in old_chunks.items():
+            if version.split("@", 1)[-1] == current_chunker:
+                return chunks
+        return next(iter(old_chunks.values()), [])
+
+    async def _reindex(self, report: Dict[str, Any], version: str):
+        key = (report["user_id"], report["report_id"])
+        try:
+            chunks = self._chunks_for(report)
+            if not chunks:
+                self._skipped.add(key)
+                REINDEXED_REPORTS.labels(result="skipped").inc()
+                return
+            vectors = await run_in_threadpool(self.embedding_service.encode_batch, chunks)
+            # The report may have been deleted or re-uploaded while it was being encoded
+            generation = self.index.add_report_if_unchanged(report["user_id"], report["report_id"],
+                                                            report["generation"], chunks, vectors, version)
+            if generation is None:
+                REINDEXED_REPORTS.labels(result="superseded").inc()
+                logger.info(f"Report {report['report_id']} changed while re-indexing, dropped its vectors")
+                return
+            self._upgraded[key] = {"version": version, "generation": generation,
+                                   "chunks": chunks, "vectors": vectors}
+            self.index.drop_stale_versions(report["user_id"], version)
+            self.reindexed += 1
+            REINDEXED_REPORTS.labels(result="success").inc()
+        except Exception as e:
+            self._skipped.add(key)
+            self.failed += 1
+            self.last_error = str(e)
+            REINDEXED_REPORTS.labels(result="failure").inc()
+            logger.error(f"Re-indexing report {report['report_id']} failed: {e}")
@@ -0,0 +1,426 @@
+# health_ai/app/services/search_index.py
+import itertools
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
+import logging
+import numpy as np
+from .metrics import observe_stage, SEARCH_VECTOR_FRACTION, STAGE_LEXICAL_SEARCH, STAGE_SIMILARITY
+from .quantization import Float32Codec
+
+logger = logging.getLogger(__name__)
+
+# Keeps clinical tokens intact: "hba1c", "v1-v4", "mg/dl", "35%", "7.2"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*%?")
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "of", "on", "or", "that", "the", "to", "was", "were", "with",
+    "what", "which", "my", "me", "i", "any", "all", "did", "do", "does",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        tokens.append(token)
+        # Let "35" match "35%" and vice versa
+        if token.endswith("%"):
+            tokens.append(token[:-1])
+    return tokens
+
+
+class _UserIndex:
+    """BM25 postings and chunk vectors for one user's reports.
+
+    The encoded vectors live in a single codec-stacked array (one row per
+    chunk), which is also what full scans score, so each vector is held
+    exactly once.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.postings = defaultdict(dict)  # term -> {chunk_key: term frequency}
+        self.doc_lengths = {}              # chunk_key -> number of terms
+        self.total_length = 0
+        self.chunks = {}                   # chunk_key -> chunk metadata and text
+        self.reports = defaultdict(list)   # report_id -> [chunk_key]
+        self.keys = []                     # row -> chunk_key
+        self.rows = {}                     # chunk_key -> row in ``vectors``
+        self.vectors = None                # codec-stacked normalized vectors
+        self.dimensions = 0
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def add_chunks(self, items: List[tuple]):
+        """Add (key, chunk, normalized vector) items in one go"""
+        if not items:
+            return
+        for key, chunk, _ in items:
+            terms = tokenize(chunk["text"])
+            for term in terms:
+                self.postings[term][key] = self.postings[term].get(key, 0) + 1
+            self.doc_lengths[key] = len(terms)
+            self.total_length += len(terms)
+            self.chunks[key] = chunk
+            self.reports[chunk["report_id"]].append(key)
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        encoded = self.codec.stack([self.codec.encode(vector) for _, _, vector in items])
+        self.vectors = encoded if self.vectors is None else self.codec.concat([self.vectors, encoded])
+        self.dimensions = len(items[-1][2])
+
+    def remove_report(self, report_id: str) -> int:
+        keys = self.reports.pop(report_id, [])
+        if not keys:
+            return 0
+        for key in keys:
+            for term in set(tokenize(self.chunks[key]["text"])):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(key)
+            del self.chunks[key]
+
+        removed = {self.rows.pop(key) for key in keys}
+        keep = [row for row in range(len(self.keys)) if row not in removed]
+        self.keys = [self.keys[row] for row in keep]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.vectors = self.codec.take(self.vectors, np.array(keep, dtype=np.intp)) if keep else None
+        return len(keys)
+
+    def vectors_for(self, keys: List[str]):
+        """Stacked vectors of the given chunks, in order"""
+        return self.codec.take(self.vectors, np.array([self.rows[k] for k in keys], dtype=np.intp))
+
+    def vector_bytes(self) -> int:
+        return self.codec.stacked_nbytes(self.vectors) if self.vectors is not None else 0
+
+
+class HybridSearchIndex:
+    """In-memory hybrid (BM25 + vector) index over report chunks.
+
+    Reports are added as they are embedded, keyed by user. A query first
+    scores chunks lexically through the inverted index; only the best
+    lexical candidates are then scored against the query vector, and the
+    two scores are fused. Queries with too few lexical hits fall back to
+    a full vector scan so paraphrased questions still work.
+
+    Vectors are stored through ``codec`` (see quantization.py), so the
+    index can hold int8 or product-quantized vectors instead of float32.
+
+    Every chunk set is tagged with the embedding version that produced it
+    (model + chunker, see EmbeddingService.version). A report can hold
+    several versions while it is being re-indexed, but a query only ever
+    scores vectors of one version.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, candidate_limit: int = 50, codec=None):
+        self.k1 = k1
+        self.b = b
+        self.candidate_limit = candidate_limit
+        self.codec = codec or Float32Codec()
+        # (user_id, version) -> postings and vectors of that version
+        self._indexes = defaultdict(lambda: _UserIndex(self.codec))
+        # user_id -> report_id -> versions indexed for the report
+        self._versions = defaultdict(lambda: defaultdict(set))
+        # (user_id, report_id) -> full report text, needed to re-chunk on upgrades
+        self._texts = {}
+        # version -> vector length, fixed by the first vectors indexed for it
+        self._dimensions = {}
+        # (user_id, report_id) -> generation, renewed whenever the report is added or removed
+        self._generations = {}
+        self._generation_counter = itertools.count(1)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def set_dimensions(self, version: str, dimensions: int):
+        """Declare the vector length of a version up front (e.g. from the model)"""
+        with self._lock:
+            self._dimensions[version] = dimensions
+
+    def _check_dimensions(self, vectors: List[List[float]], version: str):
+        """Reject vectors that could not be scored together with the rest of the index"""
+        dimensions = {len(vector) for vector in vectors}
+        if len(dimensions) > 1:
+            raise ValueError(f"vectors of one report must have the same length, got {sorted(dimensions)}")
+        expected = getattr(self.codec, "dimensions", None) or self._dimensions.get(version)
+        if expected and dimensions and dimensions != {expected}:
+            raise ValueError(f"{version} vectors must have {expected} dimensions, got {dimensions.pop()}")
+
+    def add_report(self, user_id: str, report_id: str, chunks: List[str],
+                   vectors: List[List[float]], version: str,
+                   chunk_indices: Optional[List[int]] = None, text: Optional[str] = None) -> int:
+        """Index (or re-index) one version of a report's chunks; returns the number of chunks.
+
+        Raises ValueError, without touching the index, if the vectors do not
+        match the dimension of the codec or of vectors already indexed for
+        ``version``.
+        """
+        if len(chunks) != len(vectors):
+            raise ValueError("chunks and vectors must have the same length")
+        chunk_indices = chunk_indices or list(range(len(chunks)))
+
+        with self._lock:
+            self._check_dimensions(vectors, version)
+            index = self._indexes[(user_id, version)]
+            index.remove_report(report_id)
+            index.add_chunks([
+                (f"{report_id}:{chunk_index}",
+                 {"report_id": report_id, "chunk_index": chunk_index, "text": chunk_text},
+                 self._normalize(vector))
+                for chunk_index, chunk_text, vector in zip(chunk_indices, chunks, vectors)
+            ])
+            self._versions[user_id][report_id].add(version)
+            if len(vectors):
+                self._dimensions.setdefault(version, len(vectors[0]))
+            if text:
+                self._texts[(user_id, report_id)] = text
+            self._generations[(user_id, report_id)] = next(self._generation_counter)
+        logger.info(f"Indexed {len(chunks)} chunks for report {report_id} ({version})")
+        return len(chunks)
+
+    def add_report_if_unchanged(self, user_id: str, report_id: str, generation: int,
+                                chunks: List[str], vectors: List[List[float]], version: str) -> Optional[int]:
+        """Add a version of a report unless it was removed or re-indexed since
+        ``generation`` (see stale_reports); returns the new generation, or None
+        if nothing was added"""
+        with self._lock:
+            if self._generations.get((user_id, report_id)) != generation:
+                return None
+            self.add_report(user_id, report_id, chunks, vectors, version)
+            return self._generations[(user_id, report_id)]
+
+    def generation(self, user_id: str, report_id: str) -> Optional[int]:
+        """Current generation of a report, None once it was removed"""
+        with self._lock:
+            return self._generations.get((user_id, report_id))
+
+    def remove_report(self, user_id: str, report_id: str) -> int:
+        """Remove every version of a report"""
+        with self._lock:
+            versions = self._versions.get(user_id, {}).pop(report_id, set())
+            self._texts.pop((user_id, report_id), None)
+            self._generations.pop((user_id, report_id), None)
+            return sum(self._indexes[(user_id, version)].remove_report(report_id) for version in versions)
+
+    def report_ids(self, user_id: str) -> List[str]:
+        """Reports of a user indexed under any version"""
+        with self._lock:
+            return sorted(self._versions.get(user_id, {}))
+
+    def serving_version(self, user_id: str, preferred: str) -> Optional[str]:
+        """Version to search for a user: ``preferred`` once it covers every report,
+        otherwise the version covering the most reports"""
+        with self._lock:
+            reports = self._versions.get(user_id)
+            if not reports:
+                return None
+            coverage = defaultdict(int)
+            for versions in reports.values():
+                for version in versions:
+                    coverage[version] += 1
+            if coverage.get(preferred) == len(reports):
+                return preferred
+            return max(coverage, key=lambda v: (coverage[v], v == preferred))
+
+    def search_plan(self, user_id: str, preferred: str) -> Dict[str, Optional[List[str]]]:
+        """Which version to search each of a user's reports with: ``preferred``
+        where the report has it, otherwise the serving version (or the report's
+        best covered one). Returns version -> report ids, or version -> None when
+        that version serves every report, so reports uploaded during a
+        migration stay searchable."""
+        with self._lock:
+            reports = self._versions.get(user_id)
+            if not reports:
+                return {}
+            serving = self.serving_version(user_id, preferred)
+            coverage = defaultdict(int)
+            for versions in reports.values():
+                for version in versions:
+                    coverage[version] += 1
+            plan = defaultdict(list)
+            for report_id, versions in reports.items():
+                if preferred in versions:
+                    version = preferred
+                elif serving in versions:
+                    version = serving
+                else:
+                    version = max(versions, key=lambda v: coverage[v])
+                plan[version].append(report_id)
+            if len(plan) == 1:
+                return {version: None for version in plan}
+            return {version: sorted(report_ids) for version, report_ids in plan.items()}
+
+    def stale_reports(self, version: str, limit: int) -> List[Dict[str, Any]]:
+        """Reports that have no chunks for ``version`` yet, with their current generation"""
+        stale = []
+        with self._lock:
+            for user_id, reports in self._versions.items():
+                for report_id, versions in reports.items():
+                    if version in versions:
+                        continue
+                    stale.append({
+                        "user_id": user_id,
+                        "report_id": report_id,
+                        "text": self._texts.get((user_id, report_id)),
+                        "generation": self._generations[(user_id, report_id)]
+                    })
+                    if len(stale) >= limit:
+                        return stale
+        return stale
+
+    def report_chunks(self, user_id: str, report_id: str) -> Dict[str, List[str]]:
+        """Chunk texts of a report per indexed version, in chunk order"""
+        with self._lock:
+            chunks = {}
+            for version in self._versions.get(user_id, {}).get(report_id, set()):
+                index = self._indexes[(user_id, version)]
+                keys = sorted(index.reports.get(report_id, []), key=lambda k: index.chunks[k]["chunk_index"])
+                chunks[version] = [index.chunks[k]["text"] for k in keys]
+            return chunks
+
+    def stale_count(self, version: str) -> int:
+        with self._lock:
+            return sum(
+                1 for reports in self._versions.values()
+                for versions in reports.values() if version not in versions
+            )
+
+    def drop_stale_versions(self, user_id: str, version: str) -> int:
+        """Once every report of a user has ``version``, free all other versions"""
+        with self._lock:
+            reports = self._versions.get(user_id, {})
+            if not reports or any(version not in versions for versions in reports.values()):
+                return 0
+            stale = {v for versions in reports.values() for v in versions} - {version}
+            for stale_version in stale:
+                self._indexes.pop((user_id, stale_version), None)
+            for versions in reports.values():
+                versions.intersection_update({version})
+            return len(stale)
+
+    def chunk_count(self, user_id: str, version: str) -> int:
+        with self._lock:
+            index = self._indexes.get((user_id, version))
+            return len(index.chunks) if index else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Vector memory held by the index, compared with plain float32"""
+        with self._lock:
+            indexes = list(self._indexes.items())
+            chunks = sum(len(index.chunks) for _, index in indexes)
+            vector_bytes = sum(index.vector_bytes() for _, index in indexes)
+            float32_bytes = sum(len(index.chunks) * index.dimensions * 4 for _, index in indexes)
+            versions = defaultdict(int)
+            for (_, version), index in indexes:
+                versions[version] += len(index.chunks)
+            users = len(self._versions)
+        return {
+            "codec": self.codec.name,
+            "users": users,
+            "chunks": chunks,
+            "chunks_by_version": dict(versions),
+            "vector_bytes": vector_bytes,
+            "float32_bytes": float32_bytes,
+            "compression_ratio": round(float32_bytes / vector_bytes, 2) if vector_bytes else None
+        }
+
+    def _bm25(self, index: _UserIndex, terms: List[str]) -> Dict[str, float]:
+        scores = defaultdict(float)
+        total = len(index.doc_lengths)
+        avg_length = index.avg_length or 1.0
+        for term in set(terms):
+            postings = index.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * index.doc_lengths[key] / avg_length)
+                scores[key] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, user_id: str, query: str, query_vector, version: str, top_k: int = 5,
+               alpha: float = 0.5, report_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Search a user's chunks of one embedding version.
+
+        ``query_vector`` must come from the same model as ``version``.
+        ``alpha`` weights the vector score against the (max-normalized)
+        BM25 score: 1.0 is pure semantic, 0.0 pure lexical. ``report_ids``
+        limits the search to those reports (see search_plan).
+        """
+        query_vector = self._normalize(query_vector)
+
+        with self._lock:
+            index = self._indexes.get((user_id, version))
+            if index is None or not index.chunks:
+                return {"results": [], "indexed_chunks": 0, "vectors_scored": 0,
+                        "lexical_candidates": 0, "model_version": version}
+
+            allowed = None
+            if report_ids is not None:
+                allowed = {key for report_id in report_ids for key in index.reports.get(report_id, [])}
+
+            with observe_stage(STAGE_LEXICAL_SEARCH):
+                lexical = self._bm25(index, tokenize(query))
+                if allowed is not None:
+                    lexical = {key: score for key, score in lexical.items() if key in allowed}
+                candidates = sorted(lexical, key=lexical.get, reverse=True)[:self.candidate_limit]
+
+            with observe_stage(STAGE_SIMILARITY):
+                if len(candidates) >= top_k:
+                    keys = candidates
+                    matrix = index.vectors_for(keys)
+                elif allowed is None:
+                    # Not enough exact-term matches: score every vector
+                    keys, matrix = index.keys, index.vectors
+                else:
+                    keys = [key for key in index.keys if key in allowed]
+                    matrix = index.vectors_for(keys) if keys else None
+
+                semantic = self.codec.scores(query_vector, matrix) if keys else []
+                max_lexical = max(lexical.values()) if lexical else 0.0
+
+                scored = []
+                for key, similarity in zip(keys, semantic):
+                    lexical_score = lexical.get(key, 0.0) / max_lexical if max_lexical else 0.0
+                    scored.append((alpha * float(similarity) + (1 - alpha) * lexical_score,
+                                   key, float(similarity), lexical_score))
+                scored.sort(reverse=True)
+            searched = len(index.chunks) if allowed is None else len(allowed)
+            if searched:
+                SEARCH_VECTOR_FRACTION.observe(len(keys) / searched)
+
+            results = []
+            for score, key, similarity, lexical_score in scored[:top_k]:
+                chunk = index.chunks[key]
+                results.append({
+                    "report_id": chunk["report_id"],
+                    "chunk_index": chunk["chunk_index"],
+                    "text": chunk["text"],
+                    "score": round(score, 4),
+                    "similarity": round(similarity, 4),
+                    "lexical_score": round(lexical_score, 4)
+                })
+
+            return {
+                "results": results,
+                "indexed_chunks": searched,
+                "vectors_scored": len(keys),
+                "lexical_candidates": len(lexical),
+                "model_version": version
+            }
@@ -0,0 +1,97 @@
+# health_ai/benchmarks/ocr_backends.py
+"""Compare OCR backends on scanned pages.
+
+Usage (from backend/health_ai):
+    python -m benchmarks.ocr_backends [PDF or directory ...] [--repeat N] [--pages N]
+
+Without paths the pages are synthetic scanned reports (see synthetic.py),
+so no real patient documents are needed. Every page is rendered once at
+the OCR resolution and then recognised by each available backend, so the
+numbers only cover the OCR call itself.
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+import fitz  # PyMuPDF
+
+from app.services.ocr_service import OCRProcessor, PytesseractBackend, TesseractCAPIBackend
+from . import synthetic
+
+
+def collect_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for candidate in sorted(glob.glob(os.path.join(path, "*"))):
+                with open(candidate, "rb") as f:
+                    if f.read(5) == b"%PDF-":
+                        pdfs.append(candidate)
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def render_pages(pdfs, dpi, max_pages):
+    """Render pages of PDF paths or in-memory PDF bytes"""
+    pixmaps = []
+    for pdf in pdfs:
+        with (fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")) as doc:
+            for page in doc:
+                pixmaps.append(page.get_pixmap(dpi=dpi, alpha=False))
+                if len(pixmaps) >= max_pages:
+                    return pixmaps
+    return pixmaps
+
+
+def time_backend(backend, pixmaps, dpi, repeat):
+    timings = []
+    for _ in range(repeat):
+        for pix in pixmaps:
+            start = time.perf_counter()
+            backend.recognize_pixmap(pix, dpi=dpi)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="PDFs or directories (default: synthetic scanned pages)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=5, help="synthetic pages when no paths are given")
+    parser.add_argument("--max-pages", type=int, default=20)
+    parser.add_argument("--lib-path", help="libtesseract to load instead of the default locations")
+    args = parser.parse_args()
+
+    dpi = OCRProcessor.render_dpi
+    pdfs = collect_pdfs(args.paths) if args.paths else [synthetic.make_scanned_pdf(args.pages)]
+    pixmaps = render_pages(pdfs, dpi, args.max_pages)
+    if not pixmaps:
+        parser.error("no PDF pages found")
+
+    backends = [PytesseractBackend()]
+    try:
+        backends.append(TesseractCAPIBackend(lib_path=args.lib_path))
+    except Exception as e:
+        print(f"tesseract-capi unavailable: {e}")
+
+    results = {}
+    for backend in backends:
+        # Warm-up call so engine initialisation is not counted per page
+        backend.recognize_pixmap(pixmaps[0], dpi=dpi)
+        timings = time_backend(backend, pixmaps, dpi, args.repeat)
+        results[backend.name] = statistics.mean(timings)
+        print(f"{backend.name:>16}: {len(timings)} pages, "
+              f"mean {results[backend.name] * 1000:.1f} ms/page, "
+              f"median {statistics.median(timings) * 1000:.1f} ms/page")
+        backend.close()
+
+    if len(results) > 1:
+        speedup = results["pytesseract"] / results["tesseract-capi"]
+        print(f"tesseract-capi speedup over pytesseract: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
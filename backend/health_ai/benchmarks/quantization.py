@@ -0,0 +1,88 @@
+# health_ai/benchmarks/quantization.py
+"""Memory and recall@k of compressed chunk embeddings against float32.
+
+Usage (from backend/health_ai):
+    python -m benchmarks.quantization [--reports 200] [--k 10]
+    python -m benchmarks.quantization --save-codebook storage/vectors/pq.npy
+
+Chunks of synthetic reports are embedded with the service's model (from
+the local cache) and a held-out set of chunks is used as queries. The
+codebook written by --save-codebook can be loaded by the service with
+EMBEDDING_COMPRESSION=pq and PQ_CODEBOOK_PATH.
+"""
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import time
+
+import numpy as np
+
+from app.services.quantization import Float32Codec, Int8Codec, ProductQuantizer, recall_at_k
+from . import synthetic
+
+
+def embed_corpus(reports: int) -> np.ndarray:
+    from app.services.embedding_service import EmbeddingService
+
+    service = EmbeddingService()
+    chunks = []
+    for text in synthetic.generate_corpus(reports):
+        chunks.extend(service._split_text(text))
+    vectors = service.model.encode(chunks, batch_size=64)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def evaluate(codec, corpus: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    start = time.perf_counter()
+    encoded = [codec.encode(vector) for vector in corpus]
+    stacked = codec.stack(encoded)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approx = np.stack([codec.scores(query, stacked) for query in queries])
+    search_time = time.perf_counter() - start
+
+    exact = queries @ corpus.T
+    stored = sum(codec.nbytes(e) for e in encoded)
+    return {
+        "bytes_per_vector": stored / len(corpus),
+        "reduction": corpus.nbytes / stored,
+        "recall": recall_at_k(exact, approx, k),
+        "encode_ms": encode_time * 1000,
+        "search_ms_per_query": search_time * 1000 / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed embedding evaluation")
+    parser.add_argument("--reports", type=int, default=200, help="synthetic reports to embed")
+    parser.add_argument("--queries", type=int, default=100, help="held-out chunks used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--subspaces", type=int, default=48)
+    parser.add_argument("--save-codebook", help="write the trained PQ codebook (.npy) here")
+    args = parser.parse_args()
+
+    vectors = embed_corpus(args.reports)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    queries, corpus = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    print(f"{len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+
+    pq = ProductQuantizer(subspaces=args.subspaces).fit(corpus)
+    if args.save_codebook:
+        pq.save(args.save_codebook)
+        print(f"PQ codebook written to {args.save_codebook}")
+
+    for codec in (Float32Codec(), Int8Codec(), pq):
+        stats = evaluate(codec, corpus, queries, args.k)
+        print(f"{codec.name:>5}: {stats['bytes_per_vector']:7.1f} B/vector  "
+              f"{stats['reduction']:5.1f}x smaller  recall@{args.k} {stats['recall']:.3f}  "
+              f"{stats['search_ms_per_query']:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# health_ai/benchmarks/run.py
+"""Reproducible benchmark suite for the health_ai service.
+
+Usage (from backend/health_ai):
+    python -m benchmarks.run                      # run and compare to baseline
+    python -m benchmarks.run --update-baseline    # record a new baseline
+    python -m benchmarks.run --suites ocr,ner --sizes small,medium
+
+All documents are synthetic (see benchmarks/synthetic.py) and the run is
+forced offline, so models must already be in the local Hugging Face cache.
+Each scenario runs in a forked child and records throughput, p50/p95/p99/max
+latency and the child's peak RSS, which covers native memory (MuPDF, tesseract, torch) and is not inflated by
+earlier scenarios.
+When a baseline exists, scenarios that regress by more than --threshold
+are reported and the process exits with status 1.
+"""
+import os
+
+# Never reach out to the Hugging Face hub during a benchmark run
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from . import synthetic
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+
+SUITES = ["ocr", "ner", "embedding", "http"]
+
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "units_per_sec": True,
+    "rss_growth_mb": False,
+}
+
+# Forking gives every scenario its own RSS high-water mark
+FORK_AVAILABLE = "fork" in multiprocessing.get_all_start_methods()
+
+
+class Scenario:
+    """A named, repeatable unit of work"""
+
+    def __init__(self, name: str, func, units: float, unit: str):
+        self.name = name
+        self.func = func
+        self.units = units
+        self.unit = unit
+
+
+def percentiles(values, *pcts):
+    """Percentiles interpolated between samples (numpy's default method), so
+    the tail is meaningful at small iteration counts instead of being the max"""
+    if len(values) == 1:
+        return [values[0]] * len(pcts)
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return [cuts[pct - 1] for pct in pcts]
+
+
+def max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def measure_scenario(scenario: Scenario, iterations: int, warmup: int) -> dict:
+    # In a freshly forked child the high-water mark starts at the current RSS
+    start_rss = max_rss_mb()
+    for _ in range(warmup):
+        scenario.func()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        scenario.func()
+        latencies.append(time.perf_counter() - start)
+    peak_rss = max_rss_mb()
+
+    mean = statistics.mean(latencies)
+    p50, p95, p99 = percentiles(latencies, 50, 95, 99)
+    return {
+        "iterations": iterations,
+        "unit": scenario.unit,
+        "units_per_op": scenario.units,
+        "ops_per_sec": round(1 / mean, 3),
+        "units_per_sec": round(scenario.units / mean, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "peak_rss_mb": round(peak_rss, 1),
+        "rss_growth_mb": round(peak_rss - start_rss, 1),
+    }
+
+
+def run_scenario(scenario: Scenario, iterations: int, warmup: int) -> dict:
+    """Run a scenario in a forked child so its peak RSS is its own"""
+    if not FORK_AVAILABLE:
+        stats = measure_scenario(scenario, iterations, warmup)
+        # The process-wide high-water mark says nothing about one scenario
+        stats["peak_rss_mb"] = stats["rss_growth_mb"] = None
+        return stats
+
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+
+    def child():
+        try:
+            sender.send(measure_scenario(scenario, iterations, warmup))
+        except Exception as e:
+            sender.send({"error": str(e)})
+
+    process = context.Process(target=child, name=f"benchmark-{scenario.name}")
+    process.start()
+    sender.close()
+    try:
+        stats = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"benchmark process exited with code {process.exitcode}")
+    finally:
+        process.join()
+    if "error" in stats:
+        raise RuntimeError(stats["error"])
+    return stats
+
+
+def _check(result: dict, what: str) -> dict:
+    """Services report failures in the payload; surface them as errors"""
+    if not result.get("success", False):
+        raise RuntimeError(f"{what} failed: {result.get('error')}")
+    return result
+
+
+def build_scenarios(suites, sizes, loop):
+    # Importing the app loads every model once; the service benchmarks
+    # reuse the same instances as the HTTP benchmarks. Nothing runs here:
+    # worker threads and model thread pools are only started in the
+    # forked scenario processes, where they are safe to use.
+    from app import main
+
+    run = loop.run_until_complete
+    scenarios = []
+
+    texts = {size: "\n\n".join(synthetic.generate_corpus(pages)) for size, pages in sizes.items()}
+    text_pdfs = {size: synthetic.make_text_pdf(pages) for size, pages in sizes.items()}
+    scanned_pdfs = {size: synthetic.make_scanned_pdf(pages) for size, pages in sizes.items()}
+    search_documents = main.embedding_service._split_text("\n\n".join(synthetic.generate_corpus(10)))
+    search_query = "HbA1c and metformin dose"
+
+    if "ocr" in suites:
+        for size, pages in sizes.items():
+            for kind, pdfs in (("text_pdf", text_pdfs), ("scanned_pdf", scanned_pdfs)):
+                pdf = pdfs[size]
+                scenarios.append(Scenario(
+                    f"ocr.{kind}.{size}",
+                    lambda pdf=pdf: _check(run(main.ocr_processor.process_file(
+                        pdf, "report.pdf", "application/pdf")), "OCR"),
+                    pages, "pages"
+                ))
+
+    if "ner" in suites:
+        for size, text in texts.items():
+            scenarios.append(Scenario(
+                f"ner.extract.{size}",
+                lambda text=text: _check(run(main.ner_processor.extract_entities(text)), "NER"),
+                len(text), "chars"
+            ))
+
+    if "embedding" in suites:
+        for size, text in texts.items():
+            scenarios.append(Scenario(
+                f"embedding.generate.{size}",
+                lambda text=text: _check(run(main.embedding_service.get_embeddings(text)), "Embedding"),
+                len(main.embedding_service._split_text(text)), "chunks"
+            ))
+        scenarios.append(Scenario(
+            "embedding.search",
+            lambda: _check(run(main.embedding_service.search_similar(
+                search_query, search_documents, top_k=3)), "Search"),
+            len(search_documents), "documents"
+        ))
+
+    if "http" in suites:
+        from fastapi.testclient import TestClient
+        client = TestClient(main.app)
+
+        def post(path, expected=200, **kwargs):
+            response = client.post(path, **kwargs)
+            if response.status_code != expected:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+            return response
+
+        size = "small" if "small" in sizes else next(iter(sizes))
+        pdf = text_pdfs[size]
+        text = texts[size]
+        scenarios.extend([
+            Scenario("http.ocr_process", lambda: post(
+                "/api/ocr/process", files={"file": ("report.pdf", pdf, "application/pdf")}
+            ), sizes[size], "pages"),
+            Scenario("http.ner_extract", lambda: post(
+                "/api/ner/extract", json={"text": text}
+            ), len(text), "chars"),
+            Scenario("http.embeddings_generate", lambda: post(
+                "/api/embeddings/generate", json={"text": text, "split_into_chunks": True}
+            ), len(main.embedding_service._split_text(text)), "chunks"),
+            Scenario("http.embeddings_search", lambda: post(
+                "/api/embeddings/search",
+                json={"query": search_query, "documents": search_documents, "top_k": 3}
+            ), len(search_documents), "documents"),
+        ])
+
+    return scenarios
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return human-readable regressions of results against a baseline"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="health_ai benchmark suite")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"comma separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--sizes", default="small,medium",
+                        help=f"comma separated subset of {', '.join(synthetic.SIZES)}")
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="runs per scenario; more runs give steadier p95/p99")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="allowed relative regression before failing (default 0.15)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the results to the baseline file")
+    args = parser.parse_args()
+
+    suites = [s for s in args.suites.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    try:
+        sizes = {size: synthetic.SIZES[size] for size in args.sizes.split(",") if size}
+    except KeyError as e:
+        parser.error(f"unknown size: {e}")
+
+    loop = asyncio.new_event_loop()
+    scenarios = build_scenarios(suites, sizes, loop)
+
+    results = {"environment": environment(), "scenarios": {}}
+    for scenario in scenarios:
+        try:
+            stats = run_scenario(scenario, args.iterations, args.warmup)
+            memory = (f"peak RSS {stats['peak_rss_mb']:.0f} MB (+{stats['rss_growth_mb']:.1f})"
+                      if stats["peak_rss_mb"] is not None else "")
+            print(f"{scenario.name:<28} p50 {stats['p50_ms']:>9.1f} ms  p95 {stats['p95_ms']:>9.1f} ms  "
+                  f"p99 {stats['p99_ms']:>9.1f} ms  max {stats['max_ms']:>9.1f} ms  {stats['units_per_sec']:>10.1f} {scenario.unit}/s  {memory}")
+        except Exception as e:
+            stats = {"error": str(e)}
+            print(f"{scenario.name:<28} ERROR {e}")
+        results["scenarios"][scenario.name] = stats
+    loop.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found, skipping regression check")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# health_ai/benchmarks/synthetic.py
+"""Deterministic synthetic medical reports for benchmarking.
+
+Reports are generated from a seeded RNG so that every run (and every
+machine) benchmarks exactly the same documents.
+"""
+import random
+from typing import List
+
+import fitz  # PyMuPDF
+
+MEDICATIONS = [
+    ("metformin", "500 mg twice daily"), ("atorvastatin", "40 mg nightly"),
+    ("lisinopril", "10 mg daily"), ("aspirin", "81 mg daily"),
+    ("clopidogrel", "75 mg daily"), ("metoprolol", "25 mg twice daily"),
+    ("furosemide", "40 mg daily"), ("insulin glargine", "18 units at bedtime"),
+]
+
+DIAGNOSES = [
+    "type 2 diabetes mellitus", "essential hypertension", "hyperlipidemia",
+    "anterior STEMI", "congestive heart failure", "chronic kidney disease stage 3",
+    "atrial fibrillation", "community acquired pneumonia",
+]
+
+LABS = [
+    ("HbA1c", "%", 5.2, 10.5), ("LDL cholesterol", "mg/dL", 60, 190),
+    ("creatinine", "mg/dL", 0.6, 2.4), ("hemoglobin", "g/dL", 9.5, 16.5),
+    ("potassium", "mmol/L", 3.2, 5.6), ("troponin I", "ng/mL", 0.01, 4.5),
+    ("LVEF", "%", 25, 65),
+]
+
+NARRATIVE = [
+    "The patient presented with {symptom} for {days} days.",
+    "Physical examination revealed {finding}.",
+    "An ECG showed ST elevation in leads V1-V4.",
+    "The patient underwent PCI with placement of two drug-eluting stents.",
+    "Echocardiogram demonstrated reduced left ventricular function.",
+    "The patient was counselled on diet, exercise and medication adherence.",
+    "Follow up in the cardiology clinic is arranged in {days} weeks.",
+]
+
+SYMPTOMS = ["chest pain", "dyspnea on exertion", "fatigue", "palpitations", "fever and cough"]
+FINDINGS = ["bilateral basal crackles", "mild pedal edema", "an irregular pulse", "no acute distress"]
+
+# Named document sizes, in pages
+SIZES = {"small": 1, "medium": 5, "large": 20}
+
+
+def generate_report_text(seed: int, sections: int = 4) -> str:
+    """Generate one synthetic clinical report as plain text"""
+    rng = random.Random(seed)
+    lines = [f"DISCHARGE SUMMARY - Patient #{rng.randint(10000, 99999)}", ""]
+
+    for section in range(sections):
+        lines.append(f"Assessment {section + 1}")
+        for template in rng.sample(NARRATIVE, 3):
+            lines.append(template.format(
+                symptom=rng.choice(SYMPTOMS),
+                finding=rng.choice(FINDINGS),
+                days=rng.randint(2, 14)
+            ))
+        lines.append(f"Diagnosis: {rng.choice(DIAGNOSES)}.")
+
+        lines.append("Laboratory results:")
+        for name, unit, low, high in rng.sample(LABS, 3):
+            lines.append(f"  {name}: {rng.uniform(low, high):.1f} {unit}")
+
+        lines.append("Medications:")
+        for drug, dose in rng.sample(MEDICATIONS, 2):
+            lines.append(f"  {drug} {dose}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def generate_corpus(count: int, seed: int = 0) -> List[str]:
+    """Generate ``count`` distinct report texts"""
+    return [generate_report_text(seed + i) for i in range(count)]
+
+
+def _new_text_page(doc: fitz.Document, text: str):
+    page = doc.new_page(width=595, height=842)  # A4 in points
+    page.insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=10, fontname="helv")
+    return page
+
+
+def make_text_pdf(pages: int, seed: int = 0) -> bytes:
+    """Build a PDF with a real text layer, one report per page"""
+    doc = fitz.open()
+    for i in range(pages):
+        _new_text_page(doc, generate_report_text(seed + i, sections=3))
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+
+def make_scanned_pdf(pages: int, seed: int = 0, dpi: int = 150) -> bytes:
+    """Build an image-only PDF, forcing every page down the OCR path"""
+    source = fitz.open(stream=make_text_pdf(pages, seed), filetype="pdf")
+    doc = fitz.open()
+    for page in source:
+        pix = page.get_pixmap(dpi=dpi, alpha=False, colorspace=fitz.csGRAY)
+        scanned = doc.new_page(width=page.rect.width, height=page.rect.height)
+        scanned.insert_image(scanned.rect, stream=pix.tobytes("png"))
+    source.close()
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
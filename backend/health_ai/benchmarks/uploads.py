@@ -0,0 +1,141 @@
+# health_ai/benchmarks/uploads.py
+"""Peak server memory while large OCR uploads are in flight.
+
+Usage (from backend/health_ai):
+    python -m benchmarks.uploads [--concurrency 4] [--size-mb 50]
+    python -m benchmarks.uploads --url http://localhost:8001 --pid 1234
+
+Without --url a uvicorn server is started for the run. Every upload is a
+one-page synthetic report padded with an incompressible attachment, so
+the OCR work is trivial and the numbers are dominated by how the upload
+body is handled. The server's RSS is sampled while the uploads run;
+with spooling to disk its growth stays far below the bytes in flight.
+Sampling needs psutil (pip install psutil).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import fitz  # PyMuPDF
+import httpx
+
+from . import synthetic
+
+SAMPLE_INTERVAL = 0.01
+
+
+def make_padded_pdf(size_mb: int, seed: int = 0) -> bytes:
+    """One text page plus ``size_mb`` of random bytes as an embedded file"""
+    doc = fitz.open(stream=synthetic.make_text_pdf(1, seed), filetype="pdf")
+    doc.embfile_add("padding.bin", os.urandom(size_mb * 1024 * 1024))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def start_server(port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300  # model loading
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{url}/health", timeout=1)
+            return server
+        except httpx.HTTPError:
+            if server.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+class RSSSampler(threading.Thread):
+    """Polls the resident set size of a process until stopped"""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        import psutil  # benchmark-only dependency
+        self.process = psutil.Process(pid)
+        self.peak = self.process.memory_info().rss
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def upload(url: str, pdf: bytes, errors: list):
+    try:
+        response = httpx.post(f"{url}/api/ocr/process", timeout=600,
+                              files={"file": ("report.pdf", pdf, "application/pdf")})
+        if response.status_code != 200:
+            errors.append(f"{response.status_code}: {response.text[:200]}")
+    except httpx.HTTPError as e:
+        errors.append(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--url", help="service to test instead of starting one")
+    parser.add_argument("--pid", type=int, help="server process id, required with --url")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if args.url and not args.pid:
+        parser.error("--pid is required with --url")
+
+    server = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.pid
+    else:
+        server = start_server(args.port)
+        url, pid = f"http://127.0.0.1:{args.port}", server.pid
+
+    try:
+        pdfs = [make_padded_pdf(args.size_mb, seed) for seed in range(args.concurrency)]
+        in_flight_mb = sum(len(pdf) for pdf in pdfs) / (1024 * 1024)
+        # One warm-up upload so first-request allocations are not counted
+        upload(url, pdfs[0], [])
+
+        for round_num in range(args.rounds):
+            sampler = RSSSampler(pid)
+            baseline = sampler.peak
+            sampler.start()
+            errors = []
+            threads = [threading.Thread(target=upload, args=(url, pdf, errors)) for pdf in pdfs]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            peak = sampler.stop()
+
+            growth_mb = (peak - baseline) / (1024 * 1024)
+            print(f"round {round_num + 1}: {args.concurrency} x {args.size_mb} MB uploads "
+                  f"({in_flight_mb:.0f} MB in flight) in {elapsed:.1f}s, "
+                  f"server RSS {baseline / (1024 * 1024):.0f} -> {peak / (1024 * 1024):.0f} MB "
+                  f"(+{growth_mb:.0f} MB, {growth_mb / in_flight_mb:.0%} of bytes in flight)")
+            for error in errors:
+                print(f"  upload failed: {error}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
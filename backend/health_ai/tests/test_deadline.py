@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from app.services.deadline import Deadline, RequestAborted, WorkEstimator, shed_reason
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def deadline_in(seconds):
+    return Deadline(time.time() + seconds)
+
+
+def test_deadline_from_header_is_unix_milliseconds():
+    expires_at = time.time() + 30
+    deadline = Deadline.from_header(str(int(expires_at * 1000)))
+    assert deadline.expires_at == pytest.approx(expires_at, abs=0.001)
+    assert 29 < deadline.remaining() <= 30
+
+
+@pytest.mark.parametrize("value", [None, "", "soon"])
+def test_missing_or_malformed_header_never_expires(value):
+    deadline = Deadline.from_header(value)
+    assert deadline.remaining() is None
+    assert not deadline.expired
+    deadline.check("anywhere")
+
+
+def test_check_raises_once_expired():
+    deadline = deadline_in(-1)
+    assert deadline.expired
+    with pytest.raises(RequestAborted) as aborted:
+        deadline.check("before page 2 of 5")
+    assert aborted.value.reason == "deadline"
+    assert aborted.value.where == "before page 2 of 5"
+
+
+def test_cancel_keeps_the_first_reason():
+    deadline = deadline_in(60)
+    deadline.cancel()
+    deadline.cancel("deadline")
+    assert deadline.cancelled
+    with pytest.raises(RequestAborted) as aborted:
+        deadline.check("before batch 1")
+    assert aborted.value.reason == "disconnected"
+
+
+def test_estimator_averages_per_unit_after_min_samples():
+    estimator = WorkEstimator(alpha=0.5, min_samples=2)
+    estimator.observe("ocr_page", 2, 4.0)
+    assert estimator.estimate("ocr_page", 1) is None
+    estimator.observe("ocr_page", 1, 4.0)
+    # 2s/page, then halfway to 4s/page
+    assert estimator.estimate("ocr_page", 3) == pytest.approx(9.0)
+    assert estimator.estimate("ner_chunk", 3) is None
+
+
+def test_estimator_ignores_empty_work():
+    estimator = WorkEstimator(min_samples=1)
+    estimator.observe("ocr_page", 0, 5.0)
+    assert estimator.estimate("ocr_page", 1) is None
+
+
+def test_no_shedding_without_deadline_or_estimate():
+    estimator = WorkEstimator(min_samples=1)
+    assert shed_reason(Deadline(), estimator, "ocr_page", 100) is None
+    assert shed_reason(deadline_in(1), estimator, "ocr_page", 100) is None
+
+
+def test_expired_deadline_is_shed():
+    assert shed_reason(deadline_in(-1), WorkEstimator(), "ocr_page", 1) == "Request deadline already passed"
+
+
+def test_one_slow_cold_start_does_not_shed():
+    estimator = WorkEstimator()
+    estimator.observe("ocr_page", 1, 40.0)
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+
+
+def test_shedding_recovers_through_probes():
+    clock = FakeClock()
+    estimator = WorkEstimator(min_samples=1, probe_interval=10.0, clock=clock)
+    estimator.observe("ocr_page", 1, 40.0)
+
+    # The first would-be-shed request runs as a probe, the next ones are shed
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+    reason = shed_reason(deadline_in(60), estimator, "ocr_page", 2)
+    assert reason.startswith("Estimated 80.00s of work exceeds the remaining")
+
+    # Each probe interval lets one request through; its fast pages bring the estimate down
+    for _ in range(5):
+        clock.now += 10.0
+        assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+        estimator.observe("ocr_page", 2, 4.0)
+    assert estimator.estimate("ocr_page", 2) < 60
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+
+
+def test_probes_are_per_operation():
+    clock = FakeClock()
+    estimator = WorkEstimator(min_samples=1, clock=clock)
+    estimator.observe("ocr_page", 1, 40.0)
+    estimator.observe("ner_chunk", 1, 40.0)
+
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is None
+    assert shed_reason(deadline_in(60), estimator, "ner_chunk", 2) is None
+    assert shed_reason(deadline_in(60), estimator, "ocr_page", 2) is not None
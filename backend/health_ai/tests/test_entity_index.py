@@ -0,0 +1,168 @@
+import pytest
+
+from app.services.entity_index import EntityIndex, normalize_entity_text, parse_value
+
+
+def entity(text, label, source, occurrence=0, confidence=0.9):
+    """An entity as NERProcessor returns it, located in ``source``"""
+    start = -1
+    for _ in range(occurrence + 1):
+        start = source.index(text, start + 1)
+    return {"text": text, "label": label, "confidence": confidence, "start": start, "end": start + len(text)}
+
+
+def rule_measurement(source, text, occurrence=0):
+    """A MEASUREMENT from the rule-based fallback: number plus unit, fixed confidence"""
+    return entity(text, "MEASUREMENT", source, occurrence, confidence=0.8)
+
+
+def test_normalize_entity_text():
+    assert normalize_entity_text("  Metformin,") == "metformin"
+    assert normalize_entity_text("Blood\n  Pressure:") == "blood pressure"
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("8.4 %", 8.4, "%"),
+    ("8.4%", 8.4, "%"),
+    ("120 mg/dl", 120.0, "mg/dl"),
+    ("5.6 mmol/L", 5.6, "mmol/L"),
+    ("-1.5", -1.5, ""),
+    ("< 5 mg", 5.0, "mg"),
+])
+def test_parse_value(text, value, unit):
+    assert parse_value(text) == {"value": value, "unit": unit}
+
+
+def test_parse_value_without_number():
+    assert parse_value("elevated") is None
+
+
+def test_value_attaches_to_adjacent_entity():
+    text = "HbA1c: 8.4 %"
+    entities = [entity("HbA1c", "Diagnostic_procedure", text), entity("8.4 %", "Lab_value", text)]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities, report_date="2024-01-10", text=text)
+
+    assert index.measurements("u", "hba1c") == [
+        {"report_id": "r1", "report_date": "2024-01-10", "value": 8.4, "unit": "%", "text": "8.4 %"}
+    ]
+
+
+def test_adjacent_words_beat_an_earlier_entity_on_the_line():
+    # The model tagged "Diabetes" but not "HbA1c"; the words right before the value win
+    text = "Diabetes review, HbA1c 8.4 %"
+    entities = [entity("Diabetes", "Disease_disorder", text), entity("8.4 %", "Lab_value", text)]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities, text=text)
+
+    assert [m["value"] for m in index.measurements("u", "hba1c")] == [8.4]
+    assert index.measurements("u", "diabetes") == []
+
+
+def test_value_on_next_line_does_not_attach_to_previous_line():
+    text = "HbA1c 8.4 %\n5.6 mmol/L"
+    entities = [
+        entity("HbA1c", "Diagnostic_procedure", text),
+        entity("8.4 %", "Lab_value", text),
+        entity("5.6 mmol/L", "Lab_value", text),
+    ]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities, text=text)
+
+    assert [m["value"] for m in index.measurements("u", "hba1c")] == [8.4]
+
+
+def test_value_on_next_line_uses_its_own_line():
+    text = "HbA1c 8.4 %\nGlucose 5.6 mmol/L"
+    entities = [
+        entity("HbA1c", "Diagnostic_procedure", text),
+        entity("8.4 %", "Lab_value", text),
+        entity("5.6 mmol/L", "Lab_value", text),
+    ]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities, text=text)
+
+    assert [m["value"] for m in index.measurements("u", "hba1c")] == [8.4]
+    assert [m["value"] for m in index.measurements("u", "glucose")] == [5.6]
+
+
+def test_rule_based_measurements():
+    text = "Fasting glucose: 120 mg/dl. Blood pressure 130 ml, total cholesterol 5.2 mmol/l"
+    entities = [
+        rule_measurement(text, "120 mg/dl"),
+        entity("Blood pressure", "VITAL", text, confidence=0.8),
+        rule_measurement(text, "130 ml"),
+        rule_measurement(text, "5.2 mmol/l"),
+    ]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities, text=text)
+
+    assert [m["value"] for m in index.measurements("u", "fasting glucose")] == [120.0]
+    assert [m["value"] for m in index.measurements("u", "blood pressure")] == [130.0]
+    assert [m["unit"] for m in index.measurements("u", "total cholesterol")] == ["mmol/l"]
+
+
+def test_without_text_the_nearest_entity_is_used():
+    text = "HbA1c 8.4 %"
+    entities = [entity("HbA1c", "Diagnostic_procedure", text), entity("8.4 %", "Lab_value", text)]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities)
+
+    assert [m["value"] for m in index.measurements("u", "HbA1c")] == [8.4]
+
+
+def test_value_far_from_any_term_is_not_recorded():
+    text = "HbA1c" + " " * 60 + "8.4 %"
+    entities = [entity("HbA1c", "Diagnostic_procedure", text), entity("8.4 %", "Lab_value", text)]
+    index = EntityIndex()
+    index.add_report("u", "r1", entities)
+
+    assert index.measurements("u", "hba1c") == []
+
+
+def test_find_reports_newest_first_and_label_filter():
+    index = EntityIndex()
+    first = "Started metformin"
+    second = "Metformin 500 mg, metformin continued"
+    index.add_report("u", "old", [entity("metformin", "Medication", first)], report_date="2023-05-01")
+    index.add_report("u", "new", [
+        entity("Metformin", "Medication", second),
+        entity("metformin", "Medication", second),
+    ], report_date="2024-02-01")
+
+    results = index.find_reports("u", "METFORMIN")
+    assert [r["report_id"] for r in results] == ["new", "old"]
+    assert results[0]["mention_count"] == 2
+    assert index.find_reports("u", "metformin", label="Disease_disorder") == []
+    assert index.find_reports("other", "metformin") == []
+
+
+def test_measurements_are_oldest_first():
+    index = EntityIndex()
+    for report_id, date, value in [("b", "2024-03-01", "7.1 %"), ("a", "2023-01-01", "8.4 %")]:
+        text = f"HbA1c {value}"
+        index.add_report("u", report_id, [
+            entity("HbA1c", "Diagnostic_procedure", text),
+            entity(value, "Lab_value", text),
+        ], report_date=date, text=text)
+
+    assert [m["value"] for m in index.measurements("u", "hba1c")] == [8.4, 7.1]
+
+
+def test_reindex_and_remove_report():
+    index = EntityIndex()
+    text = "HbA1c 8.4 %"
+    entities = [entity("HbA1c", "Diagnostic_procedure", text), entity("8.4 %", "Lab_value", text)]
+    index.add_report("u", "r1", entities, text=text)
+    index.add_report("u", "r1", entities, text=text)
+
+    assert index.report_count("u") == 1
+    assert len(index.measurements("u", "hba1c")) == 1
+    assert index.report_ids("u") == ["r1"]
+
+    assert index.remove_report("u", "r1") is True
+    assert index.remove_report("u", "r1") is False
+    assert index.find_reports("u", "hba1c") == []
+    assert index.measurements("u", "hba1c") == []
+    assert index.summary("u") == {}
+    assert index.report_ids("u") == []
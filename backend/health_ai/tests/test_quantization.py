@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from app.services.quantization import Float32Codec, Int8Codec, ProductQuantizer, create_codec, recall_at_k
+
+
+def normalized(rng, count, dimensions):
+    vectors = rng.normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_round_trip_error_is_small():
+    rng = np.random.default_rng(0)
+    codec = Int8Codec()
+    for vector in normalized(rng, 10, 32):
+        codes, scale = codec.encode(vector)
+        assert codes.dtype == np.int8
+        # Rounding error is at most half a quantization step
+        assert np.abs(codec.decode((codes, scale)) - vector).max() <= scale / 2 + 1e-6
+
+
+def test_int8_zero_vector():
+    codes, scale = Int8Codec().encode(np.zeros(8))
+    assert not codes.any()
+    assert scale == 1.0
+
+
+def test_int8_scores_match_decoded_vectors():
+    rng = np.random.default_rng(1)
+    codec = Int8Codec()
+    encoded = [codec.encode(v) for v in normalized(rng, 20, 16)]
+    query = normalized(rng, 1, 16)[0]
+
+    expected = np.array([codec.decode(e) @ query for e in encoded])
+    np.testing.assert_allclose(codec.scores(query, codec.stack(encoded)), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_int8_base64_round_trip():
+    codec = Int8Codec()
+    vector = np.linspace(-1, 1, 12, dtype=np.float32)
+    stored = codec.to_base64(vector)
+    codes, scale = codec.from_base64(stored["codes"], stored["scale"])
+
+    expected_codes, expected_scale = codec.encode(vector)
+    np.testing.assert_array_equal(codes, expected_codes)
+    assert scale == expected_scale
+    assert codec.nbytes((codes, scale)) == 12 + 4
+
+
+def test_pq_requires_divisible_dimensions_and_enough_vectors():
+    rng = np.random.default_rng(2)
+    with pytest.raises(ValueError):
+        ProductQuantizer(subspaces=5, centroids=4).fit(normalized(rng, 50, 16))
+    with pytest.raises(ValueError):
+        ProductQuantizer(subspaces=4, centroids=64).fit(normalized(rng, 10, 16))
+    with pytest.raises(ValueError):
+        ProductQuantizer(centroids=512)
+
+
+def test_pq_encode_decode_and_scores():
+    rng = np.random.default_rng(3)
+    vectors = normalized(rng, 300, 16)
+    pq = ProductQuantizer(subspaces=4, centroids=16).fit(vectors, iterations=10)
+
+    assert pq.trained and pq.dimensions == 16
+    codes = pq.encode_batch(vectors)
+    assert codes.shape == (300, 4) and codes.dtype == np.uint8
+    np.testing.assert_array_equal(pq.encode(vectors[0]), codes[0])
+
+    # The lookup-table scores equal inner products with the decoded vectors
+    query = normalized(rng, 1, 16)[0]
+    decoded = np.stack([pq.decode(c) for c in codes])
+    np.testing.assert_allclose(pq.scores(query, pq.stack(list(codes))), decoded @ query, rtol=1e-4, atol=1e-5)
+
+    # Trained codes reconstruct far better than random ones
+    random_codes = rng.integers(16, size=codes.shape, dtype=np.uint8)
+    random_decoded = np.stack([pq.decode(c) for c in random_codes])
+    error = np.linalg.norm(decoded - vectors, axis=1).mean()
+    assert error < 0.5 * np.linalg.norm(random_decoded - vectors, axis=1).mean()
+
+
+def test_pq_save_and_load(tmp_path):
+    rng = np.random.default_rng(4)
+    pq = ProductQuantizer(subspaces=2, centroids=8).fit(normalized(rng, 50, 8), iterations=5)
+    path = tmp_path / "codebook.npy"
+    pq.save(path)
+
+    loaded = ProductQuantizer.load(path)
+    assert (loaded.subspaces, loaded.centroids, loaded.dimensions) == (2, 8, 8)
+    np.testing.assert_array_equal(loaded.codebook, pq.codebook)
+
+
+def test_recall_at_k():
+    exact = np.array([[0.9, 0.8, 0.1, 0.0], [0.1, 0.2, 0.3, 0.4]])
+    assert recall_at_k(exact, exact, k=2) == 1.0
+    approx = np.array([[0.9, 0.0, 0.8, 0.1], [0.4, 0.3, 0.2, 0.1]])
+    assert recall_at_k(exact, approx, k=2) == pytest.approx(0.25)
+
+
+def test_create_codec(tmp_path):
+    assert isinstance(create_codec(None), Float32Codec)
+    assert isinstance(create_codec("INT8"), Int8Codec)
+    # Without a usable codebook PQ falls back to int8
+    assert isinstance(create_codec("pq"), Int8Codec)
+    assert isinstance(create_codec("pq", str(tmp_path / "missing.npy")), Int8Codec)
+
+    rng = np.random.default_rng(5)
+    path = tmp_path / "codebook.npy"
+    ProductQuantizer(subspaces=2, centroids=8).fit(normalized(rng, 50, 8), iterations=5).save(path)
+    assert isinstance(create_codec("pq", str(path)), ProductQuantizer)
+
+
+def test_int8_block_scoring_matches_whole_matrix():
+    rng = np.random.default_rng(6)
+    codec = Int8Codec()
+    stacked = codec.stack([codec.encode(v) for v in normalized(rng, 50, 16)])
+    query = normalized(rng, 1, 16)[0]
+    codes, scales = stacked
+    expected = (codes.astype(np.float32) @ query) * scales
+
+    codec.score_block_rows = 7
+    np.testing.assert_allclose(codec.scores(query, stacked), expected, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("codec", [Float32Codec(), Int8Codec()])
+def test_take_and_concat_keep_rows(codec):
+    rng = np.random.default_rng(7)
+    vectors = normalized(rng, 6, 8)
+    stacked = codec.concat([codec.stack([codec.encode(v) for v in vectors[:4]]),
+                            codec.stack([codec.encode(v) for v in vectors[4:]])])
+    query = normalized(rng, 1, 8)[0]
+    scores = codec.scores(query, stacked)
+
+    np.testing.assert_allclose(codec.scores(query, codec.take(stacked, np.array([5, 1]))), scores[[5, 1]], rtol=1e-5, atol=1e-6)
+    assert codec.stacked_nbytes(stacked) == sum(codec.nbytes(codec.encode(v)) for v in vectors)
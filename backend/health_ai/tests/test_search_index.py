@@ -0,0 +1,215 @@
+import numpy as np
+import pytest
+
+from app.services.quantization import Int8Codec
+from app.services.search_index import HybridSearchIndex, tokenize
+
+VERSION = "test-model@chunker-v1"
+
+
+def one_hot(position, dimensions=8):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    vector[position] = 1.0
+    return vector
+
+
+def test_tokenize_keeps_clinical_tokens():
+    tokens = tokenize("The HbA1c was 8.4% (LVEF 35%), leads V1-V4, glucose 120 mg/dl")
+    for token in ["hba1c", "8.4%", "8.4", "lvef", "35%", "35", "v1-v4", "mg/dl", "120"]:
+        assert token in tokens
+    assert "the" not in tokens
+    assert "was" not in tokens
+
+
+def test_bm25_ranks_exact_term_match_first():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["metformin 500 mg twice daily", "blood pressure stable"],
+                     [one_hot(0), one_hot(1)], VERSION)
+    index.add_report("u", "r2", ["atorvastatin 40 mg nightly"], [one_hot(2)], VERSION)
+
+    result = index.search("u", "metformin", one_hot(5), VERSION, top_k=1, alpha=0.0)
+
+    assert result["results"][0]["report_id"] == "r1"
+    assert result["results"][0]["chunk_index"] == 0
+    assert result["results"][0]["lexical_score"] == 1.0
+
+
+def test_lexical_candidates_limit_vector_scoring():
+    index = HybridSearchIndex(candidate_limit=3)
+    chunks = [f"troponin result {i}" for i in range(10)] + [f"unrelated note {i}" for i in range(10)]
+    index.add_report("u", "r1", chunks, [one_hot(i % 8) for i in range(20)], VERSION)
+
+    result = index.search("u", "troponin", one_hot(0), VERSION, top_k=2)
+
+    assert result["lexical_candidates"] == 10
+    assert result["vectors_scored"] == 3
+    assert result["indexed_chunks"] == 20
+
+
+def test_few_lexical_hits_fall_back_to_full_vector_scan():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["shortness of breath", "chest pain", "fatigue"],
+                     [one_hot(0), one_hot(1), one_hot(2)], VERSION)
+
+    # Paraphrase without shared terms: only the vector can find it
+    result = index.search("u", "dyspnea", one_hot(0), VERSION, top_k=2, alpha=0.5)
+
+    assert result["vectors_scored"] == 3
+    assert result["results"][0]["text"] == "shortness of breath"
+
+
+def test_remove_report_clears_postings_and_ids():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["metformin dose"], [one_hot(0)], VERSION)
+    index.add_report("u", "r2", ["insulin dose"], [one_hot(1)], VERSION)
+
+    assert index.remove_report("u", "r1") == 1
+
+    assert index.report_ids("u") == ["r2"]
+    assert "metformin" not in index._indexes[("u", VERSION)].postings
+    result = index.search("u", "metformin", one_hot(0), VERSION, top_k=5)
+    assert {hit["report_id"] for hit in result["results"]} == {"r2"}
+
+
+def test_mismatched_dimensions_are_rejected_without_changes():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["metformin"], [one_hot(0)], VERSION)
+
+    with pytest.raises(ValueError):
+        index.add_report("u", "r1", ["short vector"], [[1.0, 2.0, 3.0]], VERSION)
+    with pytest.raises(ValueError):
+        index.add_report("u", "r2", ["a", "b"], [one_hot(0), one_hot(0, dimensions=4)], VERSION)
+
+    assert index.report_ids("u") == ["r1"]
+    assert index.search("u", "metformin", one_hot(0), VERSION)["results"][0]["text"] == "metformin"
+
+
+def test_declared_dimensions_apply_before_first_report():
+    index = HybridSearchIndex()
+    index.set_dimensions(VERSION, 8)
+
+    with pytest.raises(ValueError):
+        index.add_report("u", "r1", ["bad"], [[1.0, 2.0, 3.0]], VERSION)
+
+
+def test_serving_version_waits_for_full_coverage():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["a"], [one_hot(0)], "old@chunker-v1")
+    index.add_report("u", "r2", ["b"], [one_hot(1)], "old@chunker-v1")
+    index.add_report("u", "r1", ["a"], [one_hot(0, 4)], "new@chunker-v1")
+
+    assert index.serving_version("u", "new@chunker-v1") == "old@chunker-v1"
+    assert index.drop_stale_versions("u", "new@chunker-v1") == 0
+
+    index.add_report("u", "r2", ["b"], [one_hot(1, 4)], "new@chunker-v1")
+
+    assert index.serving_version("u", "new@chunker-v1") == "new@chunker-v1"
+    assert index.drop_stale_versions("u", "new@chunker-v1") == 1
+    assert index.chunk_count("u", "old@chunker-v1") == 0
+
+
+def test_int8_codec_keeps_ranking():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 16)).astype(np.float32)
+    chunks = [f"chunk {i}" for i in range(20)]
+    exact = HybridSearchIndex()
+    compressed = HybridSearchIndex(codec=Int8Codec())
+    for index in (exact, compressed):
+        index.add_report("u", "r1", chunks, vectors, VERSION)
+
+    query = vectors[3] + 0.1 * rng.normal(size=16).astype(np.float32)
+    top_exact = [hit["chunk_index"] for hit in exact.search("u", "zzz", query, VERSION, top_k=3, alpha=1.0)["results"]]
+    top_int8 = [hit["chunk_index"] for hit in compressed.search("u", "zzz", query, VERSION, top_k=3, alpha=1.0)["results"]]
+
+    assert top_exact[0] == 3
+    assert top_int8 == top_exact
+
+
+def test_add_report_if_unchanged_skips_removed_and_reindexed_reports():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["a"], [one_hot(0)], "old@chunker-v1")
+    index.add_report("u", "r2", ["b"], [one_hot(1)], "old@chunker-v1")
+    stale = {r["report_id"]: r["generation"] for r in index.stale_reports("new@chunker-v1", limit=10)}
+
+    # Deleted while its new vectors were being encoded
+    index.remove_report("u", "r1")
+    assert not index.add_report_if_unchanged("u", "r1", stale["r1"], ["a"], [one_hot(0, 4)], "new@chunker-v1")
+    assert index.report_ids("u") == ["r2"]
+
+    # Re-uploaded in the meantime, then removed and re-added under the same id
+    index.add_report("u", "r2", ["b2"], [one_hot(1, 4)], "new@chunker-v1")
+    assert not index.add_report_if_unchanged("u", "r2", stale["r2"], ["b"], [one_hot(2, 4)], "new@chunker-v1")
+    assert index.report_chunks("u", "r2")["new@chunker-v1"] == ["b2"]
+
+
+def test_add_report_if_unchanged_adds_untouched_report():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["a"], [one_hot(0)], "old@chunker-v1")
+    [report] = index.stale_reports("new@chunker-v1", limit=10)
+
+    generation = index.add_report_if_unchanged("u", "r1", report["generation"], ["a"], [one_hot(0, 4)], "new@chunker-v1")
+    assert generation == index.generation("u", "r1") != report["generation"]
+    assert index.stale_count("new@chunker-v1") == 0
+
+
+def test_rows_stay_aligned_after_removing_a_middle_report():
+    index = HybridSearchIndex()
+    for i, report_id in enumerate(["r1", "r2", "r3"]):
+        index.add_report("u", report_id, [f"note {report_id} a", f"note {report_id} b"],
+                         [one_hot(2 * i), one_hot(2 * i + 1)], VERSION)
+    index.remove_report("u", "r2")
+
+    for position, text in [(0, "note r1 a"), (1, "note r1 b"), (4, "note r3 a"), (5, "note r3 b")]:
+        # Full scan (no lexical hits) and candidate scoring must find the same vector
+        [hit] = index.search("u", "zzz", one_hot(position), VERSION, top_k=1, alpha=1.0)["results"]
+        assert hit["text"] == text
+    result = index.search("u", "note", one_hot(5), VERSION, top_k=1, alpha=1.0)
+    assert result["vectors_scored"] == 4
+    assert result["results"][0]["text"] == "note r3 b"
+
+
+def test_stats_report_the_memory_actually_held():
+    index = HybridSearchIndex(codec=Int8Codec())
+    rng = np.random.default_rng(0)
+    index.add_report("u", "r1", [f"chunk {i}" for i in range(100)], rng.normal(size=(100, 384)), VERSION)
+    user_index = index._indexes[("u", VERSION)]
+    codes, scales = user_index.vectors
+
+    stats = index.stats()
+    # One int8 code per dimension plus one float32 scale per vector, held once
+    assert stats["vector_bytes"] == codes.nbytes + scales.nbytes == 100 * (384 + 4)
+    assert stats["compression_ratio"] == round(100 * 384 * 4 / (100 * 388), 2)
+
+    index.remove_report("u", "r1")
+    assert index.stats()["vector_bytes"] == 0
+
+
+def test_search_plan_keeps_new_uploads_searchable():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["metformin"], [one_hot(0)], "old@chunker-v1")
+    index.add_report("u", "r2", ["insulin"], [one_hot(1)], "old@chunker-v1")
+    index.add_report("u", "r3", ["warfarin"], [one_hot(2, 4)], "new@chunker-v1")
+
+    assert index.search_plan("u", "new@chunker-v1") == {
+        "old@chunker-v1": ["r1", "r2"], "new@chunker-v1": ["r3"]
+    }
+    # A report already re-indexed is searched with the new version only
+    index.add_report("u", "r1", ["metformin"], [one_hot(0, 4)], "new@chunker-v1")
+    assert index.search_plan("u", "new@chunker-v1") == {
+        "old@chunker-v1": ["r2"], "new@chunker-v1": ["r1", "r3"]
+    }
+    index.add_report("u", "r2", ["insulin"], [one_hot(1, 4)], "new@chunker-v1")
+    assert index.search_plan("u", "new@chunker-v1") == {"new@chunker-v1": None}
+    assert index.search_plan("nobody", "new@chunker-v1") == {}
+
+
+def test_search_limited_to_reports():
+    index = HybridSearchIndex()
+    index.add_report("u", "r1", ["warfarin dose", "warfarin stopped"], [one_hot(0), one_hot(1)], VERSION)
+    index.add_report("u", "r2", ["warfarin started"], [one_hot(2)], VERSION)
+
+    for query, top_k in [("warfarin", 1), ("zzz", 5)]:
+        result = index.search("u", query, one_hot(0), VERSION, top_k=top_k, report_ids=["r2"])
+        assert [hit["report_id"] for hit in result["results"]] == ["r2"]
+        assert result["indexed_chunks"] == 1
+    assert index.search("u", "warfarin", one_hot(0), VERSION, report_ids=["gone"])["results"] == []
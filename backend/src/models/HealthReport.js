@@ -10,6 +10,9 @@ const entitySchema = new mongoose.Schema({
 
 const embeddingSchema = new mongoose.Schema({
   vector: [Number],
+  // int8 compressed alternative to vector: base64 codes and their scale
+  codes: String,
+  scale: Number,
   text: String,
   chunkIndex: Number
 });
@@ -42,6 +45,10 @@ const healthReportSchema = new mongoose.Schema({
     of: [entitySchema]
   },
   embeddings: [embeddingSchema],
+  // Embedding model + chunker version of the stored vectors (unset = legacy)
+  embeddingVersion: {
+    type: String
+  },
   summary: {
     type: String,
     default: ''
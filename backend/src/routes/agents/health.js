@@ -24,6 +24,22 @@ const upload = multer({
 
 // AI service URL
 const HEALTH_AI_SERVICE = process.env.HEALTH_AI_SERVICE || 'http://localhost:8001';
+// Set when the AI service mounts this server's uploads/ dir as its SHARED_UPLOAD_DIR
+const SHARED_UPLOADS = process.env.HEALTH_AI_SHARED_UPLOADS === 'true';
+// Set to 'int8' to store compact int8 embeddings instead of float arrays
+const EMBEDDING_COMPRESSION = process.env.HEALTH_EMBEDDING_COMPRESSION;
+
+// Request timeouts for the AI service
+const OCR_TIMEOUT = 60000; // 1 minute
+const TEXT_TIMEOUT = 30000;
+// How often re-embedded reports are fetched from the AI service and stored
+const UPGRADE_SYNC_INTERVAL = 60000;
+
+// Tells the AI service when we stop waiting (Unix ms), so it can reject
+// work it cannot finish in time and abandon work we have given up on
+const deadlineHeader = (timeout) => ({
+  'X-Request-Deadline': String(Date.now() + timeout)
+});
 
 // Upload and process a health report
 router.post('/upload-report', auth, upload.single('file'), async (req, res) => {
@@ -56,7 +72,7 @@ router.post('/upload-report', auth, upload.single('file'), async (req, res) => {
     await healthReport.save();
 
     // Process the document asynchronously
-    processDocument(req.file, healthReport._id, req.user.id)
+    processDocument(req.file, healthReport._id, req.user.id, healthReport.uploadDate)
       .catch(error => {
         console.error('Error in background processing:', error);
       });
@@ -83,34 +99,56 @@ router.post('/upload-report', auth, upload.single('file'), async (req, res) => {
 });
 
 // Asynchronous document processing function
-async function processDocument(file, reportId, userId) {
+async function processDocument(file, reportId, userId, reportDate) {
   try {
-    // Create form data for OCR API
-    const formData = new FormData();
-    formData.append('file', fs.createReadStream(file.path), {
-      filename: file.originalname,
-      contentType: file.mimetype
-    });
-
     // Step 1: Extract text with OCR
-    const ocrResponse = await axios.post(
-      `${HEALTH_AI_SERVICE}/api/ocr/process`,
-      formData,
-      {
-        headers: { ...formData.getHeaders() },
-        timeout: 60000 // 1 minute timeout
-      }
-    );
+    let ocrResponse;
+    if (SHARED_UPLOADS) {
+      // Co-located AI service reads the file straight from the shared upload dir
+      ocrResponse = await axios.post(
+        `${HEALTH_AI_SERVICE}/api/ocr/process-local`,
+        {
+          path: path.basename(file.path),
+          filename: file.originalname,
+          mime_type: file.mimetype
+        },
+        {
+          headers: { 'Content-Type': 'application/json', ...deadlineHeader(OCR_TIMEOUT) },
+          timeout: OCR_TIMEOUT
+        }
+      );
+    } else {
+      // Create form data for OCR API
+      const formData = new FormData();
+      formData.append('file', fs.createReadStream(file.path), {
+        filename: file.originalname,
+        contentType: file.mimetype
+      });
+
+      ocrResponse = await axios.post(
+        `${HEALTH_AI_SERVICE}/api/ocr/process`,
+        formData,
+        {
+          headers: { ...formData.getHeaders(), ...deadlineHeader(OCR_TIMEOUT) },
+          timeout: OCR_TIMEOUT
+        }
+      );
+    }
 
     const ocrResult = ocrResponse.data;
 
     // Step 2: Extract medical entities with NER
     const nerResponse = await axios.post(
       `${HEALTH_AI_SERVICE}/api/ner/extract`,
-      { text: ocrResult.text },
+      {
+        text: ocrResult.text,
+        user_id: String(userId),
+        report_id: String(reportId),
+        report_date: reportDate ? reportDate.toISOString() : undefined
+      },
       { 
-        headers: { 'Content-Type': 'application/json' },
-        timeout: 30000
+        headers: { 'Content-Type': 'application/json', ...deadlineHeader(TEXT_TIMEOUT) },
+        timeout: TEXT_TIMEOUT
       }
     );
 
@@ -121,34 +159,26 @@ async function processDocument(file, reportId, userId) {
       `${HEALTH_AI_SERVICE}/api/embeddings/generate`,
       { 
         text: ocrResult.text,
-        split_into_chunks: true
+        split_into_chunks: true,
+        user_id: String(userId),
+        report_id: String(reportId),
+        compression: EMBEDDING_COMPRESSION || undefined
       },
       { 
-        headers: { 'Content-Type': 'application/json' },
-        timeout: 30000
+        headers: { 'Content-Type': 'application/json', ...deadlineHeader(TEXT_TIMEOUT) },
+        timeout: TEXT_TIMEOUT
       }
     );
     
     const embeddingResult = embeddingResponse.data;
-    
-    // Process embeddings for storage
-    const embeddingsForStorage = [];
-    if (embeddingResult.embeddings && embeddingResult.chunks) {
-      for (let i = 0; i < embeddingResult.embeddings.length; i++) {
-        embeddingsForStorage.push({
-          vector: embeddingResult.embeddings[i],
-          text: embeddingResult.chunks[i],
-          chunkIndex: i
-        });
-      }
-    }
 
     // Update report with all processed data
     await HealthReport.findByIdAndUpdate(reportId, {
       extractedText: ocrResult.text,
       entities: nerResult.entities,
       entityGroups: nerResult.entity_groups,
-      embeddings: embeddingsForStorage,
+      embeddings: embeddingsForStorage(embeddingResult),
+      embeddingVersion: embeddingResult.model_version,
       status: 'completed'
     });
 
@@ -160,12 +190,18 @@ async function processDocument(file, reportId, userId) {
   } catch (error) {
     console.error('Document processing error:', error);
     
-    // Update report status to failed
+    // Update report status to failed, keeping the AI service's reason (e.g. 503 when shed)
     await HealthReport.findByIdAndUpdate(reportId, {
       status: 'failed',
-      error: error.message
+      error: (error.response && error.response.data && error.response.data.detail) || error.message
     });
 
+    // The AI service may already have indexed the report (entities are indexed during
+    // NER, before embedding), or did so after this side timed out; failed reports must
+    // not show up in search or entity lookups
+    await removeFromAIIndex('index', userId, reportId);
+    await removeFromAIIndex('entities', userId, reportId);
+
     // Clean up uploaded file
     fs.unlink(file.path, (err) => {
       if (err) console.error('Error deleting temp file:', err);
@@ -173,6 +209,33 @@ async function processDocument(file, reportId, userId) {
   }
 }
 
+// Embeddings as returned by the AI service, in the shape stored on the report
+function embeddingsForStorage(embeddingResult) {
+  const stored = [];
+  if (embeddingResult.embeddings && embeddingResult.chunks) {
+    for (let i = 0; i < embeddingResult.embeddings.length; i++) {
+      const embedding = embeddingResult.compressed_embeddings
+        ? embeddingResult.compressed_embeddings[i]
+        : { vector: embeddingResult.embeddings[i] };
+      stored.push({
+        ...embedding,
+        text: embeddingResult.chunks[i],
+        chunkIndex: i
+      });
+    }
+  }
+  return stored;
+}
+
+// Remove a report from one of the AI service's in-memory indexes ('index' or 'entities')
+async function removeFromAIIndex(index, userId, reportId) {
+  try {
+    await axios.delete(`${HEALTH_AI_SERVICE}/api/${index}/reports/${userId}/${reportId}`);
+  } catch (error) {
+    console.error(`Could not remove report ${reportId} from the AI ${index} index:`, error.message);
+  }
+}
+
 // Get all reports for a user
 router.get('/reports', auth, async (req, res) => {
   try {
@@ -224,6 +287,199 @@ router.get('/reports/:id', auth, async (req, res) => {
   }
 });
 
+// The AI service keeps its entity index in memory; load any completed report
+// of the user it does not hold (e.g. after it restarted) from Mongo. Returns the
+// ids of the completed reports, the only ones whose entities may be shown
+async function ensureEntityIndex(userId) {
+  const reports = await HealthReport.find({ userId, status: 'completed' }).select('_id');
+  const completedIds = new Set(reports.map(report => String(report._id)));
+  if (reports.length === 0) {
+    return completedIds;
+  }
+
+  const { data } = await axios.get(`${HEALTH_AI_SERVICE}/api/entities/reports/${userId}`);
+  const indexed = new Set(data.report_ids);
+  const missingIds = reports.map(report => report._id).filter(id => !indexed.has(String(id)));
+  if (missingIds.length === 0) {
+    return completedIds;
+  }
+
+  const missing = await HealthReport.find({ _id: { $in: missingIds } })
+    .select('entities extractedText reportDate uploadDate');
+
+  for (const report of missing) {
+    try {
+      await axios.post(
+        `${HEALTH_AI_SERVICE}/api/entities/reports`,
+        {
+          user_id: String(userId),
+          report_id: String(report._id),
+          report_date: (report.reportDate || report.uploadDate).toISOString(),
+          entities: report.entities.map(({ text, label, confidence, start, end }) => ({
+            text, label, confidence, start, end
+          })),
+          text: report.extractedText
+        },
+        { headers: { 'Content-Type': 'application/json' } }
+      );
+    } catch (error) {
+      // One unloadable report must not take entity lookups down for the user
+      console.error(`Could not index entities of report ${report._id}:`, error.message);
+    }
+  }
+
+  return completedIds;
+}
+
+// Find reports mentioning an entity, e.g. ?text=metformin&label=Medication
+router.get('/entities/search', auth, async (req, res) => {
+  try {
+    const { text, label } = req.query;
+    if (!text || typeof text !== 'string') {
+      return res.status(400).json({
+        success: false,
+        message: 'Entity text is required'
+      });
+    }
+
+    const completedIds = await ensureEntityIndex(req.user.id);
+
+    const response = await axios.get(`${HEALTH_AI_SERVICE}/api/entities/search`, {
+      params: { user_id: String(req.user.id), text, label }
+    });
+    // A report that failed after its entities were extracted may still be indexed
+    const results = response.data.results.filter(result => completedIds.has(result.report_id));
+
+    res.json({
+      success: true,
+      count: results.length,
+      data: results
+    });
+  } catch (error) {
+    console.error('Entity search error:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Error searching entities',
+      error: error.message
+    });
+  }
+});
+
+// Every recorded value of a lab test over time, e.g. ?analyte=HbA1c
+router.get('/entities/measurements', auth, async (req, res) => {
+  try {
+    const { analyte } = req.query;
+    if (!analyte || typeof analyte !== 'string') {
+      return res.status(400).json({
+        success: false,
+        message: 'Analyte is required'
+      });
+    }
+
+    const completedIds = await ensureEntityIndex(req.user.id);
+
+    const response = await axios.get(`${HEALTH_AI_SERVICE}/api/entities/measurements`, {
+      params: { user_id: String(req.user.id), analyte }
+    });
+
+    res.json({
+      success: true,
+      data: response.data.results.filter(result => completedIds.has(result.report_id))
+    });
+  } catch (error) {
+    console.error('Measurement lookup error:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Error fetching measurements',
+      error: error.message
+    });
+  }
+});
+
+// The AI service keeps its search index in memory; load any of these reports
+// it does not hold (e.g. after it restarted) from the chunks stored in Mongo
+async function ensureSearchIndex(userId, reports) {
+  const { data } = await axios.get(`${HEALTH_AI_SERVICE}/api/index/reports/${userId}`);
+  const indexed = new Set(data.report_ids);
+  const missingIds = reports.map(report => report._id).filter(id => !indexed.has(String(id)));
+  if (missingIds.length === 0) {
+    return;
+  }
+
+  const missing = await HealthReport.find({
+    _id: { $in: missingIds },
+    'embeddings.0': { $exists: true }
+  }).select('embeddings embeddingVersion extractedText');
+
+  for (const report of missing) {
+    try {
+      await axios.post(
+        `${HEALTH_AI_SERVICE}/api/index/reports`,
+        {
+          user_id: String(userId),
+          report_id: String(report._id),
+          version: report.embeddingVersion || undefined,
+          text: report.extractedText || undefined,
+          chunks: report.embeddings.map(embedding => (
+            embedding.codes
+              ? { text: embedding.text, codes: embedding.codes, scale: embedding.scale, chunk_index: embedding.chunkIndex }
+              : { text: embedding.text, vector: embedding.vector, chunk_index: embedding.chunkIndex }
+          ))
+        },
+        { headers: { 'Content-Type': 'application/json' } }
+      );
+    } catch (error) {
+      // One unloadable report must not take search down for the user
+      console.error(`Could not index report ${report._id}:`, error.message);
+    }
+  }
+}
+
+// The AI service re-embeds reports in the background when its embedding model
+// changes; store the new vectors so they survive its restarts
+async function storeUpgradedEmbeddings() {
+  for (;;) {
+    const { data } = await axios.get(`${HEALTH_AI_SERVICE}/api/index/upgraded`, {
+      params: { limit: 20, compression: EMBEDDING_COMPRESSION || undefined }
+    });
+    if (data.reports.length === 0) {
+      return;
+    }
+
+    const stored = [];
+    for (const report of data.reports) {
+      try {
+        await HealthReport.updateOne(
+          { _id: report.report_id, userId: report.user_id, status: 'completed' },
+          { embeddings: embeddingsForStorage(report), embeddingVersion: report.model_version }
+        );
+        // Also acknowledged when the report no longer exists, there is nothing left to store
+        stored.push({ user_id: report.user_id, report_id: report.report_id, generation: report.generation });
+      } catch (error) {
+        console.error(`Could not store re-embedded report ${report.report_id}:`, error.message);
+      }
+    }
+
+    if (stored.length > 0) {
+      await axios.post(
+        `${HEALTH_AI_SERVICE}/api/index/upgraded/ack`,
+        { reports: stored },
+        { headers: { 'Content-Type': 'application/json' } }
+      );
+    }
+    // Unstored reports are retried on the next run
+    if (stored.length < data.reports.length) {
+      return;
+    }
+  }
+}
+
+setInterval(() => {
+  storeUpgradedEmbeddings().catch(error => {
+    console.error('Storing re-embedded reports failed:', error.message);
+  });
+}, UPGRADE_SYNC_INTERVAL).unref();
+
 // Search across reports using semantic search
 router.post('/search', auth, async (req, res) => {
   try {
@@ -236,11 +492,11 @@ router.post('/search', auth, async (req, res) => {
       });
     }
     
-    // Get all user reports with completed status
+    // Get all user reports with completed status (names only, chunks live in the AI index)
     const reports = await HealthReport.find({ 
       userId: req.user.id,
       status: 'completed'
-    });
+    }).select('filename');
     
     if (reports.length === 0) {
       return res.json({
@@ -249,51 +505,35 @@ router.post('/search', auth, async (req, res) => {
       });
     }
     
-    // Extract chunks from all reports for semantic search
-    const allChunks = [];
-    const chunkToReportMap = [];
-    
+    const reportNames = {};
     reports.forEach(report => {
-      if (report.embeddings && report.embeddings.length > 0) {
-        report.embeddings.forEach(embedding => {
-          allChunks.push(embedding.text);
-          chunkToReportMap.push({
-            reportId: report._id,
-            reportName: report.filename,
-            chunkIndex: embedding.chunkIndex
-          });
-        });
-      }
+      reportNames[String(report._id)] = report.filename;
     });
-    
-    // If no chunks, return empty results
-    if (allChunks.length === 0) {
-      return res.json({
-        success: true,
-        data: []
-      });
-    }
-    
-    // Perform semantic search using the AI service
+
+    await ensureSearchIndex(req.user.id, reports);
+
+    // Perform hybrid (lexical + semantic) search using the AI service
     const searchResponse = await axios.post(
-      `${HEALTH_AI_SERVICE}/api/embeddings/search`,
+      `${HEALTH_AI_SERVICE}/api/search/hybrid`,
       {
+        user_id: String(req.user.id),
         query: query,
-        documents: allChunks,
-        top_k: Math.min(5, allChunks.length)
+        top_k: 5
       },
       { headers: { 'Content-Type': 'application/json' } }
     );
     
-    // Map results back to reports
-    const searchResults = searchResponse.data.results.map(result => {
-      const reportInfo = chunkToReportMap[result.index];
-      return {
-        ...result,
-        reportId: reportInfo.reportId,
-        reportName: reportInfo.reportName
-      };
-    });
+    // Map results back to reports, skipping reports that are not completed (a failed
+    // report can still be indexed if it finished after this side gave up on it)
+    const searchResults = searchResponse.data.results
+      .filter(result => reportNames[result.report_id] !== undefined)
+      .map(result => ({
+        document: result.text,
+        similarity: result.score,
+        chunkIndex: result.chunk_index,
+        reportId: result.report_id,
+        reportName: reportNames[result.report_id]
+      }));
     
     res.json({
       success: true,